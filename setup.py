@@ -15,6 +15,14 @@ MRU_REQUIRES = [
     'zc.resourcelibrary',
 ]
 
+NUMPY_REQUIRES = [
+    'numpy',
+]
+
+ZODB_REQUIRES = [
+    'ZODB',
+]
+
 TEST_REQUIRES = [
     'zope.app.appsetup',
     'zope.app.principalannotation',
@@ -75,13 +83,16 @@ setup(
         'zope.formlib >= 4.0',
         'zope.index',
         'zope.interface',
+        'zope.intid',
         'zope.publisher',
         'zope.schema >= 3.6',
         'zope.security',
     ],
     extras_require=dict(
         mruwidget=MRU_REQUIRES,
-        test=MRU_REQUIRES + TEST_REQUIRES,
+        numpy=NUMPY_REQUIRES,
+        zodb=ZODB_REQUIRES,
+        test=MRU_REQUIRES + NUMPY_REQUIRES + ZODB_REQUIRES + TEST_REQUIRES,
         slimtest=TEST_REQUIRES,
     ),
     zip_safe=False
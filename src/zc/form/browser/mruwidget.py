@@ -12,20 +12,34 @@
 #
 ##############################################################################
 """source input widget with most recently used (MRU) value support"""
+import collections.abc
+import hashlib
 import html
+import json
 
 import persistent.list
 import zc.resourcelibrary
 import zope.annotation.interfaces
 import zope.browser.interfaces
 import zope.component
+import zope.formlib.i18n
 import zope.formlib.interfaces
+import zope.i18n
 from BTrees import OOBTree
 from zope.formlib.source import SourceInputWidget
 
+from zc.form.i18n import _
+
 
 class MruSourceInputWidget(SourceInputWidget):
     ANNOTATION_KEY = 'zc.form.browser.mruwidget'
+    # Query results which are sequences are shown a page at a time.
+    page_size = 20
+    # Whether to sort the results by title or keep the order of the query.
+    sort_results = True
+    # The name of a `QueryResultsView` of the source, used by the browser to
+    # search while the user types.
+    results_view = None
 
     def hasInput(self):
         return self.name + '.displayed' in self.request
@@ -145,6 +159,8 @@ class MruSourceInputWidget(SourceInputWidget):
             result.append('      <div class="queryinput">')
             result.append(queryview.render(name))
             result.append('      </div> <!-- queryinput -->')
+            if self.results_view is not None:
+                result.append(self._renderTypeahead(name))
 
             qresults = queryview.results(name)
             if qresults:
@@ -155,3 +171,155 @@ class MruSourceInputWidget(SourceInputWidget):
         result.append('  </div> <!-- queries -->')
         result.append('</div> <!-- value -->')
         return '\n'.join(result)
+
+    def getResultsOffset(self, name, total):
+        """Return the offset of the page of query results to show."""
+        try:
+            offset = int(self.request.form.get(name + '.offset', 0))
+        except (TypeError, ValueError):
+            offset = 0
+        if offset >= total:
+            offset = (total - 1) // self.page_size * self.page_size
+        return max(offset, 0)
+
+    def _renderResults(self, results, name):
+        if self.sort_results:
+            # Sort all the results, so the pages follow each other by title.
+            entries = sorted(self._titleAndToken(value) for value in results)
+            lookup = None
+        else:
+            if not isinstance(results, collections.abc.Sequence):
+                results = list(results)
+            entries = results
+            # Only the results on the page get looked up.
+            lookup = self._titleAndToken
+        total = len(entries)
+        page_size = self.page_size
+        offset = self.getResultsOffset(name, total)
+        page = entries[offset:offset + page_size]
+        if lookup is not None:
+            page = [lookup(value) for value in page]
+        rendered = self._renderSelection(page, name)
+        if offset == 0 and total <= page_size:
+            return rendered
+        # Query views only search if their search button was pressed, so the
+        # page buttons send it along.
+        buttons = ['<input type="hidden" name="%s.search" value="y" />'
+                   % name]
+        if offset > 0:
+            buttons.append(self._renderPageButton(
+                name, max(offset - page_size, 0),
+                _('mruwidget-previous_page', 'Previous')))
+        buttons.append('<span class="range">%s</span>' % html.escape(
+            self._translate(_('mruwidget-results_range',
+                              '${first}-${last} of ${total}',
+                              mapping={'first': offset + 1,
+                                       'last': min(offset + page_size, total),
+                                       'total': total}))))
+        if offset + page_size < total:
+            buttons.append(self._renderPageButton(
+                name, offset + page_size, _('mruwidget-next_page', 'Next')))
+        return '%s\n<div class="pages">\n%s\n</div>' % (
+            rendered, '\n'.join(buttons))
+
+    def _titleAndToken(self, value):
+        term = self.terms.getTerm(value)
+        return self._translate(term.title), term.token
+
+    def _renderSelection(self, entries, name):
+        options = ['<option value="%s">%s</option>'
+                   % (html.escape(token), html.escape(title))
+                   for title, token in entries]
+        return ('<select name="%s.selection">\n%s\n</select>\n'
+                '<input type="submit" name="%s.apply" value="%s" />'
+                % (name, '\n'.join(options), name, self._translate(
+                    zope.formlib.i18n._('SourceInputWidget-apply',
+                                        default='Apply'))))
+
+    def _renderPageButton(self, name, offset, label):
+        return ('<button type="submit" name="%s.offset" value="%d">%s'
+                '</button>' % (name, offset,
+                               html.escape(self._translate(label))))
+
+    def _renderTypeahead(self, name):
+        url = '%s/@@%s' % (self.request.getApplicationURL(),
+                           self.results_view)
+        labels = {
+            'apply': self._translate(zope.formlib.i18n._(
+                'SourceInputWidget-apply', default='Apply')),
+            'next': self._translate(_('mruwidget-next_page', 'Next')),
+        }
+        arguments = ', '.join(
+            json.dumps(argument).replace('</', '<\\/')
+            for argument in (name, url, labels))
+        return ('      <script type="text/javascript">'
+                'zc_mruwidget_typeahead(%s);</script>' % arguments)
+
+
+class QueryResultsView:
+    """The results of the query view of a source as JSON.
+
+    The request has the fields the query view renders, as the form would
+    send them, and ``zc.form.query``, the name of the query view.  The
+    response is an object with the `total` number of results, the `offset`
+    of the page and the `results` on the page, each with the `token` and
+    the `title` of its term.  Subclasses set the `source`, and set
+    `sort_results` like the widget does, so both show the same order.
+    """
+
+    source = None
+    page_size = MruSourceInputWidget.page_size
+    sort_results = MruSourceInputWidget.sort_results
+    cache_control = 'private, max-age=0, must-revalidate'
+
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+    def getResults(self):
+        request = self.request
+        name = request.form.get('zc.form.query', 'query')
+        queryview = zope.component.getMultiAdapter(
+            (self.source, request), zope.formlib.interfaces.ISourceQueryView)
+        terms = zope.component.getMultiAdapter(
+            (self.source, request), zope.browser.interfaces.ITerms)
+        results = queryview.results(name)
+        if results is None:
+            results = ()
+        if self.sort_results:
+            # Like the widget, sort all the results by title.
+            results = sorted(
+                (terms.getTerm(value) for value in results),
+                key=lambda term: (self._translate(term.title), term.token))
+            getTerm = None
+        else:
+            if not isinstance(results, collections.abc.Sequence):
+                results = list(results)
+            getTerm = terms.getTerm
+        try:
+            offset = max(int(request.form.get(name + '.offset', 0)), 0)
+        except (TypeError, ValueError):
+            offset = 0
+        # Only the results on the page get looked up.
+        items = []
+        for item in results[offset:offset + self.page_size]:
+            term = item if getTerm is None else getTerm(item)
+            items.append({'token': term.token,
+                          'title': self._translate(term.title)})
+        return {'total': len(results), 'offset': offset, 'results': items}
+
+    def _translate(self, text):
+        return zope.i18n.translate(text, context=self.request, default=text)
+
+    def __call__(self):
+        body = json.dumps(self.getResults(), sort_keys=True).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        response = self.request.response
+        response.setHeader('Content-Type', 'application/json;charset=utf-8')
+        response.setHeader('Cache-Control', self.cache_control)
+        response.setHeader('ETag', etag)
+        if_none_match = self.request.getHeader('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')]:
+            response.setStatus(304)
+            return b''
+        return body
@@ -11,3 +11,152 @@ function zc_mruwidget_toggleQueriesDisplay(id) {
         input.value = 'no';
     }
 }
+
+function zc_mruwidget_ancestor(element, className) {
+    while (element && (' ' + element.className + ' ').indexOf(
+               ' ' + className + ' ') < 0) {
+        element = element.parentNode;
+    }
+    return element;
+}
+
+function zc_mruwidget_queryString(name, queryinput) {
+    // Send the fields of the query view as the form would, with the first
+    // button, so the query view searches.
+    var params = ['zc.form.query=' + encodeURIComponent(name)];
+    var button = false;
+    var fields = queryinput.getElementsByTagName('input');
+    for (var i = 0; i < fields.length; i++) {
+        var field = fields[i];
+        if (!field.name) {
+            continue;
+        }
+        if (field.type == 'submit' || field.type == 'button') {
+            if (button) {
+                continue;
+            }
+            button = true;
+        }
+        else if ((field.type == 'checkbox' || field.type == 'radio')
+                 && !field.checked) {
+            continue;
+        }
+        params.push(encodeURIComponent(field.name) + '='
+                    + encodeURIComponent(field.value));
+    }
+    var selects = queryinput.getElementsByTagName('select');
+    for (var i = 0; i < selects.length; i++) {
+        if (selects[i].name) {
+            params.push(encodeURIComponent(selects[i].name) + '='
+                        + encodeURIComponent(selects[i].value));
+        }
+    }
+    return params.join('&');
+}
+
+function zc_mruwidget_showResults(name, query, data, labels) {
+    var container = null;
+    for (var child = query.firstChild; child; child = child.nextSibling) {
+        if (child.className == 'queryresults') {
+            container = child;
+        }
+    }
+    if (!data.results.length) {
+        if (container) {
+            query.removeChild(container);
+        }
+        return;
+    }
+    if (!container) {
+        container = document.createElement('div');
+        container.className = 'queryresults';
+        query.appendChild(container);
+    }
+    while (container.firstChild) {
+        container.removeChild(container.firstChild);
+    }
+    var select = document.createElement('select');
+    select.name = name + '.selection';
+    for (var i = 0; i < data.results.length; i++) {
+        var option = document.createElement('option');
+        option.value = data.results[i].token;
+        option.appendChild(document.createTextNode(data.results[i].title));
+        select.appendChild(option);
+    }
+    container.appendChild(select);
+    var apply = document.createElement('input');
+    apply.type = 'submit';
+    apply.name = name + '.apply';
+    apply.value = labels.apply;
+    container.appendChild(apply);
+    if (data.offset + data.results.length < data.total) {
+        // Further pages are shown by submitting the form.
+        var next = document.createElement('button');
+        next.type = 'submit';
+        next.name = name + '.offset';
+        next.value = data.offset + data.results.length;
+        next.appendChild(document.createTextNode(labels.next));
+        // The query view only searches if its search button was pressed.
+        var search = document.createElement('input');
+        search.type = 'hidden';
+        search.name = name + '.search';
+        search.value = 'y';
+        var pages = document.createElement('div');
+        pages.className = 'pages';
+        pages.appendChild(search);
+        pages.appendChild(next);
+        container.appendChild(pages);
+    }
+}
+
+function zc_mruwidget_typeahead(name, url, labels) {
+    // Search while the user types, without submitting the form.
+    var input = document.getElementById(name + '.searchstring');
+    var queryinput = zc_mruwidget_ancestor(input, 'queryinput');
+    if (!input || !queryinput || !window.XMLHttpRequest) {
+        return;
+    }
+    var query = queryinput.parentNode;
+    var last = input.value;
+    var timer = null;
+    var request = null;
+
+    function search() {
+        if (request) {
+            request.abort();
+        }
+        var text = input.value;
+        if (!text.replace(/\s+/g, '')) {
+            zc_mruwidget_showResults(name, query, {results: []}, labels);
+            return;
+        }
+        request = new XMLHttpRequest();
+        var current = request;
+        request.onreadystatechange = function () {
+            if (current.readyState != 4 || current !== request) {
+                return;
+            }
+            request = null;
+            if (current.status == 200 && input.value == text) {
+                zc_mruwidget_showResults(
+                    name, query, JSON.parse(current.responseText), labels);
+            }
+        };
+        request.open(
+            'GET', url + '?' + zc_mruwidget_queryString(name, queryinput),
+            true);
+        request.send(null);
+    }
+
+    input.setAttribute('autocomplete', 'off');
+    input.onkeyup = function () {
+        if (input.value == last) {
+            return;
+        }
+        last = input.value;
+        if (timer) {
+            clearTimeout(timer);
+        }
+        timer = setTimeout(search, 200);
+    };
+}
@@ -28,6 +28,7 @@ from zope.security.checker import NamesChecker
 
 import zc.form.browser.mruwidget
 import zc.form.interfaces
+import zc.form.tzsearch
 
 
 ALL_TIMEZONES = frozenset(pytz.all_timezones)
@@ -43,20 +44,18 @@ pytz.tzinfo.BaseTzInfo.__Security_checker__ = checker
 
 class TimeZoneWidget(zc.form.browser.mruwidget.MruSourceInputWidget):
 
+    # The query view ranks the time zones.
+    sort_results = False
+    results_view = 'zc.form.timezones.json'
+
     def getMostRecentlyUsedTerms(self):
         mru = super().getMostRecentlyUsedTerms()
         # add ones from locale
         territory = self.request.locale.id.territory
         if territory:
-            try:
-                choices = pytz.country_timezones(territory)
-            except KeyError:
-                pass
-            else:
-                already = {term.token for term in mru}
-                additional = sorted(t for t in choices if t not in already)
-                mru.extend(zc.form.interfaces.Term(t.replace('_', ' '), t)
-                           for t in additional)
+            already = {term.token for term in mru}
+            mru.extend(term for term in zc.form.tzsearch.getTerritoryTerms(
+                territory) if term.token not in already)
         return mru
 
 
@@ -76,13 +75,20 @@ class TimeZoneQueryView:
                             button_name=name + '.search')
 
     def results(self, name):
-        if not (name + '.search' in self.request):
+        # The widget shows another page of the results with the offset.
+        if not (name + '.search' in self.request
+                or name + '.offset' in self.request):
             return None
 
-        searchstring = self.request[name + '.searchstring'].lower()
-        timezones = []
-        searchstring = searchstring.strip().lower().replace(' ', '_')  # regex
-        for tz in ALL_TIMEZONES:
-            if searchstring in tz.lower():
-                timezones.append(pytz.timezone(tz))
-        return timezones
+        searchstring = self.request[name + '.searchstring']
+        return zc.form.tzsearch.TimeZones(
+            zc.form.tzsearch.getTimeZoneSearch().search(searchstring))
+
+
+class TimeZoneQueryResultsView(zc.form.browser.mruwidget.QueryResultsView):
+    """The time zones matching a search as JSON."""
+
+    source = zc.form.interfaces.AvailableTimeZones()
+    sort_results = TimeZoneWidget.sort_results
+    # The results only change with the time zone data of pytz.
+    cache_control = 'public, max-age=86400'
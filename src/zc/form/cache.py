@@ -0,0 +1,142 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Caches used by fields and constraints"""
+import collections
+import threading
+
+import zope.publisher.interfaces
+import zope.security.management
+
+
+_marker = object()
+
+
+class LRUCache:
+    """A bounded mapping which discards the least recently used entries.
+
+    >>> cache = LRUCache(2)
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.set('c', 3)
+    >>> cache.get('b') is None
+    True
+    >>> cache.get('b', 'missing')
+    'missing'
+    >>> cache.get('c')
+    3
+    >>> len(cache)
+    2
+    >>> sorted(cache.statistics().items())
+    [('evictions', 1), ('hits', 2), ('maxsize', 2), ('misses', 2), ('size', 2)]
+
+    Clearing the cache keeps the counters:
+
+    >>> cache.clear()
+    >>> len(cache), cache.hits
+    (0, 2)
+
+    Copies and pickles of a cache are empty, with the same size:
+
+    >>> import copy
+    >>> cache.set('a', 1)
+    >>> clone = copy.deepcopy(cache)
+    >>> len(clone), clone.maxsize, clone.hits
+    (0, 2, 0)
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'maxsize': self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxsize'])
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _marker)
+            if value is _marker:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def statistics(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self._data),
+                'maxsize': self.maxsize}
+
+
+def getRequest():
+    """Return the request of the current interaction, or None."""
+    interaction = zope.security.management.queryInteraction()
+    if interaction is not None:
+        for participation in interaction.participations:
+            if zope.publisher.interfaces.IRequest.providedBy(participation):
+                return participation
+    return None
+
+
+def getRequestCache(name, request=None):
+    """Return a dict cache which lives as long as the request.
+
+    The request of the current interaction is used if no request is given.
+    Returns None if there is no request.
+
+    >>> from zope.publisher.browser import TestRequest
+    >>> getRequestCache('example') is None
+    True
+    >>> request = TestRequest()
+    >>> zope.security.management.newInteraction(request)
+    >>> cache = getRequestCache('example')
+    >>> cache['key'] = 'value'
+    >>> getRequestCache('example') is cache
+    True
+    >>> getRequestCache('example', TestRequest()) is cache
+    False
+    >>> zope.security.management.endInteraction()
+    >>> getRequestCache('example', request)
+    {'key': 'value'}
+    """
+    if request is None:
+        request = getRequest()
+        if request is None:
+            return None
+    key = 'zc.form.cache.' + name
+    cache = request.annotations.get(key)
+    if cache is None:
+        cache = request.annotations[key] = {}
+    return cache
@@ -0,0 +1,409 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Compile schemas using zc.form fields into specialized validators.
+
+Validating a value with a field binds the field to the context, and nested
+`Combination` and `Union` fields go through `validate`, `_validate` and the
+constraints for each level.  `compileField` builds a function doing the
+same checks with the nesting flattened into closures: fields which do not
+depend on their context are used without binding them, type checks are
+done inline and `OrderedCombinationConstraint` is called directly.  The
+errors raised are the ones of the normal path.
+
+    >>> import datetime
+    >>> from zope import interface, schema
+    >>> from zc.form.field import Combination, OrderedCombinationConstraint
+    >>> from zc.form.field import Option, Union
+    >>> class IDemo(interface.Interface):
+    ...     publication_range = Combination(
+    ...         (schema.Date(title=u'Begin', required=False),
+    ...          schema.Date(title=u'Expire', required=True)),
+    ...         title=u'Publication Range',
+    ...         constraints=(OrderedCombinationConstraint(),))
+    ...     size = Union(
+    ...         (schema.Int(title=u'Pixels', min=0),
+    ...          Option(title=u'Automatic', value=u'auto')),
+    ...         title=u'Size')
+
+    >>> validate = compileField(IDemo['publication_range'])
+    >>> validate((datetime.date(2005, 6, 22), datetime.date(2005, 7, 10)), None)
+    >>> validate((datetime.date(2005, 6, 22), None), None)
+    Traceback (most recent call last):
+    ...
+    RequiredMissing: combination_01
+    >>> validate((datetime.date(2005, 6, 22), datetime.date(1995, 7, 10)),
+    ...          None) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    MessageValidationError: (u'${minimum} must be less than or equal to ...
+
+`getSchemaValidator` compiles a whole schema.  The validator returns the
+``(name, error)`` pairs `zope.schema.getSchemaValidationErrors` returns:
+
+    >>> @interface.implementer(IDemo)
+    ... class Demo:
+    ...     publication_range = None
+    ...     size = u'auto'
+    >>> demo = Demo()
+    >>> validator = getSchemaValidator(IDemo)
+    >>> validator(demo)
+    [('publication_range', RequiredMissing('publication_range'))]
+    >>> demo.publication_range = (None, datetime.date(2005, 7, 10))
+    >>> demo.size = -1
+    >>> validator(demo)
+    [('size', MessageValidationError('No unioned field validates ${value}.', {'value': -1}))]
+    >>> schema.getSchemaValidationErrors(IDemo, demo) == validator(demo)
+    True
+
+The validator is compiled once for each schema:
+
+    >>> getSchemaValidator(IDemo) is validator
+    True
+
+It is compiled again when an attribute of one of its fields, nested fields
+included, is changed:
+
+    >>> demo.size = 10
+    >>> IDemo['size'].fields[0].max = 5
+    >>> getSchemaValidator(IDemo) is validator
+    False
+    >>> getSchemaValidator(IDemo)(demo)
+    [('size', MessageValidationError('No unioned field validates ${value}.', {'value': 10}))]
+    >>> IDemo['size'].required = False
+    >>> demo.size = None
+    >>> validator = getSchemaValidator(IDemo)
+    >>> validator(demo)
+    []
+    >>> schema.getSchemaValidationErrors(IDemo, demo)
+    []
+    >>> IDemo['size'].required = True
+    >>> validator = getSchemaValidator(IDemo)
+    >>> validator(demo)
+    [('size', RequiredMissing('size'))]
+    >>> IDemo['size'].fields[0].max = None
+    >>> demo.size = -1
+
+It is compiled again when the schema changes, e.g. its bases:
+
+    >>> class IBase(interface.Interface):
+    ...     name = schema.TextLine(title=u'Name')
+    >>> IDemo.__bases__ = (IBase,)
+    >>> new_validator = getSchemaValidator(IDemo)
+    >>> new_validator is validator
+    False
+    >>> sorted(name for name, error in new_validator(demo))
+    ['name', 'size']
+
+`invalidate` drops the compiled validator of a schema:
+
+    >>> invalidate(IDemo)
+    >>> getSchemaValidator(IDemo) is new_validator
+    False
+"""  # noqa
+import threading
+import weakref
+
+import zope.schema.interfaces
+from zope import schema
+from zope.interface.interfaces import IMethod
+from zope.schema.interfaces import RequiredMissing
+from zope.schema.interfaces import SchemaNotFullyImplemented
+from zope.schema.interfaces import StopValidation
+from zope.schema.interfaces import ValidationError
+from zope.schema.interfaces import WrongType
+
+from zc.form.field import BaseField
+from zc.form.field import Combination
+from zc.form.field import MessageValidationError
+from zc.form.field import Option
+from zc.form.field import OrderedCombinationConstraint
+from zc.form.field import Union
+from zc.form.field import _combination_not_a_sequence_error
+from zc.form.field import _combination_wrong_size_error
+from zc.form.field import _no_unioned_field_validates
+
+
+_CONTEXT_DEPENDENT = (
+    zope.schema.interfaces.IChoice,
+    zope.schema.interfaces.ICollection,
+    zope.schema.interfaces.IDict,
+    zope.schema.interfaces.IObject,
+)
+
+
+def _needsContext(field):
+    """Tell whether validating with the field may depend on its context."""
+    if isinstance(field, BaseField):
+        if field.constraints or isinstance(field, tuple(_compilers)):
+            return True
+    elif not type(field).__module__.startswith('zope.schema.'):
+        return True  # we do not know what the field does
+    for iface in _CONTEXT_DEPENDENT:
+        if iface.providedBy(field):
+            return True
+    return False
+
+
+def _compileMissing(field, validate_present):
+    """Wrap a validator of present values with the missing value check."""
+    missing_value = field.missing_value
+    required = field.required
+    name = field.__name__
+
+    def validate(value, context):
+        if value == missing_value:
+            if required:
+                raise RequiredMissing(name).with_field_and_value(field, value)
+        else:
+            validate_present(value, context)
+    return validate
+
+
+def _compileLeaf(field):
+    if _needsContext(field):
+        def validate(value, context):
+            field.bind(context).validate(value)
+        return validate
+    if type(field).validate is not schema.Field.validate:
+        def validate(value, context):
+            field.validate(value)
+        return validate
+    type_ = field._type
+    name = field.__name__
+    _validate = field._validate
+
+    def validate_present(value, context):
+        if type_ is not None and not isinstance(value, type_):
+            raise WrongType(value, type_, name).with_field_and_value(
+                field, value)
+        try:
+            _validate(value)
+        except StopValidation:
+            pass
+    return _compileMissing(field, validate_present)
+
+
+def _compileOption(field):
+    value_getter = field.value_getter
+    identity_comparison = field.identity_comparison
+    if value_getter is None:
+        option = field.value
+
+        def getValue(context):
+            return option
+    elif field.cache_value:
+        def getValue(context):
+            return field.bind(context).getValue()
+    else:
+        getValue = value_getter
+
+    def validate_present(value, context):
+        if identity_comparison:
+            if getValue(context) is not value:
+                raise WrongType
+        elif getValue(context) != value:
+            raise WrongType
+
+    # Option fields are never required
+    missing_value = field.missing_value
+
+    def validate(value, context):
+        if value != missing_value:
+            validate_present(value, context)
+    return validate
+
+
+def _compileConstraints(field):
+    """Return a function applying the constraints of the field, or None."""
+    if (field.constraint_statistics is not None
+            or field.constraint_cache is not None or field.io_constraints):
+        # let the field order, cache, record and await its constraints
+        bind = schema.Field.bind
+
+        def apply(value, context):
+            BaseField._validate(bind(field, context), value)
+        return apply
+    constraints = field.constraints
+    field_constraint = field.constraint
+    if not constraints and getattr(
+            field_constraint, '__func__', None) is schema.Field.constraint:
+        return None
+    calls = []
+    for constraint in constraints:
+        if type(constraint) is OrderedCombinationConstraint:
+            # does not depend on the context of the field
+            calls.append((constraint, False))
+        else:
+            calls.append((constraint, True))
+    bind = schema.Field.bind  # without binding the contained fields
+
+    def apply(value, context):
+        bound = None
+        if not field_constraint(value):
+            raise zope.schema.interfaces.ConstraintNotSatisfied(
+                value, field.__name__).with_field_and_value(field, value)
+        for constraint, needs_context in calls:
+            if needs_context:
+                if bound is None:
+                    bound = bind(field, context)
+                constraint(bound, value)
+            else:
+                constraint(field, value)
+    return apply
+
+
+def _compileCombination(field):
+    members = tuple(compileField(f) for f in field.fields)
+    size = len(members)
+    constraints = _compileConstraints(field)
+
+    def validate_present(value, context):
+        try:
+            len_value = len(value)
+        except (TypeError, AttributeError):
+            raise MessageValidationError(_combination_not_a_sequence_error)
+        if len_value != size:
+            raise MessageValidationError(_combination_wrong_size_error)
+        for v, validate in zip(value, members):
+            validate(v, context)
+        if constraints is not None:
+            constraints(value, context)
+    return _compileMissing(field, validate_present)
+
+
+def _compileProbe(field):
+    """Return a function telling whether the field accepts a value."""
+    validate = compileField(field)
+
+    def probe(value, context):
+        try:
+            validate(value, context)
+        except ValidationError:
+            return False
+        return True
+    return probe
+
+
+def _compileUnion(field):
+    probes = tuple(_compileProbe(f) for f in field.fields)
+    candidates = field._candidates
+
+    def validate_present(value, context):
+        for ix in candidates(value):
+            if probes[ix](value, context):
+                return
+        raise MessageValidationError(
+            _no_unioned_field_validates, {'value': value})
+    return _compileMissing(field, validate_present)
+
+
+_compilers = {
+    Combination: _compileCombination,
+    Option: _compileOption,
+    Union: _compileUnion,
+}
+
+
+def compileField(field):
+    """Return a function validating a value for a context.
+
+    ``compileField(field)(value, context)`` raises the error
+    ``field.bind(context).validate(value)`` raises.
+    """
+    compiler = _compilers.get(type(field), _compileLeaf)
+    return compiler(field)
+
+
+def _schemaFields(iface):
+    fields = []
+    for name in iface.names(all=True):
+        attribute = iface[name]
+        if IMethod.providedBy(attribute):
+            continue
+        if zope.schema.interfaces.IValidatable.providedBy(attribute):
+            fields.append((name, attribute))
+    return fields
+
+
+def _allFields(fields):
+    """Return the fields and the fields they contain, recursively."""
+    result = []
+    todo = list(fields)
+    while todo:
+        field = todo.pop()
+        result.append(field)
+        if isinstance(field, (Combination, Union)):
+            todo.extend(field.fields)
+    return result
+
+
+def _fingerprint(fields):
+    """Return the attribute values of the fields the validators depend on.
+
+    The validators capture them when they are compiled, so changing one of
+    them (e.g. ``required``) needs another compilation.
+    """
+    return [tuple(field.__dict__.values()) for field in fields]
+
+
+def compileSchema(iface):
+    """Return a function validating an object against the schema.
+
+    The function returns the list of ``(name, error)`` pairs
+    `zope.schema.getSchemaValidationErrors` returns.
+    """
+    validators = [(name, field, compileField(field))
+                  for name, field in _schemaFields(iface)]
+
+    def validate(obj):
+        errors = []
+        for name, field, validate in validators:
+            try:
+                validate(getattr(obj, name), obj)
+            except ValidationError as error:
+                errors.append((name, error))
+            except AttributeError as error:
+                errors.append((name, SchemaNotFullyImplemented(
+                    error).with_field_and_value(field, None)))
+        return errors
+    return validate
+
+
+_validators = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def getSchemaValidator(iface):
+    """Return the compiled validator of the schema.
+
+    The validator is compiled once and compiled again when the schema or
+    an attribute of one of its fields changes.
+    """
+    entry = _validators.get(iface)
+    # Changing an interface recomputes its resolution order.
+    if (entry is None or entry[0] is not iface.__sro__
+            or entry[2] != _fingerprint(entry[1])):
+        with _lock:
+            sro = iface.__sro__
+            fields = _allFields(
+                field for name, field in _schemaFields(iface))
+            entry = _validators[iface] = (
+                sro, fields, _fingerprint(fields), compileSchema(iface))
+    return entry[3]
+
+
+def invalidate(iface):
+    """Drop the compiled validator of the schema."""
+    with _lock:
+        _validators.pop(iface, None)
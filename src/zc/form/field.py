@@ -15,22 +15,43 @@
 
 $Id: field.py 4634 2006-01-06 20:21:15Z fred $
 """
+import asyncio
+import concurrent.futures
+import contextlib
+import datetime
+import functools
+import inspect
+import threading
+import time
+import weakref
+
 import zope.catalog.interfaces
 import zope.index.text.parsetree
 import zope.index.text.queryparser
+import zope.intid.interfaces
 from zope import component
 from zope import i18n
 from zope import interface
 from zope import schema
 from zope.interface.exceptions import DoesNotImplement
 from zope.schema.interfaces import IField
+from zope.schema.interfaces import RequiredMissing
+from zope.schema.interfaces import StopValidation
 from zope.schema.interfaces import ValidationError
 from zope.schema.interfaces import WrongType
 
 from zc.form import interfaces
+from zc.form.cache import LRUCache
+from zc.form.cache import getRequestCache
 from zc.form.i18n import _
 
 
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+
 _no_unioned_field_validates = _(
     "No unioned field validates ${value}.")
 
@@ -40,6 +61,34 @@ _range_less_equal_error = _(
 _combination_wrong_size_error = _("The value has the wrong number of members")
 _combination_not_a_sequence_error = _("The value is not a sequence")
 _bad_query = _("Invalid query.")
+_expensive_query = _("The query is too expensive.")
+_not_unique = _("${value} is already used.")
+
+_marker = object()
+
+PARSED_QUERIES = 'parsed-queries'
+COMPUTED_VALUES = 'computed-values'
+
+
+def _computeCached(getter, context):
+    """Call getter with the context, once per request if there is one."""
+    computed = getRequestCache(COMPUTED_VALUES)
+    if computed is None:
+        return getter(context)
+    key = (getter, id(context))
+    entry = computed.get(key)
+    if entry is None or entry[0] is not context:
+        entry = computed[key] = (context, getter(context))
+    return entry[1]
+
+
+def _invalidateCached(getter, context=None):
+    computed = getRequestCache(COMPUTED_VALUES)
+    if computed:
+        for key in list(computed):
+            if key[0] is getter and (
+                    context is None or computed[key][0] is context):
+                del computed[key]
 
 # Union field that accepts other fields...
 
@@ -58,6 +107,383 @@ class MessageValidationError(ValidationError):
         return self.message
 
 
+class Verdict:
+    """The outcome of checking a value without raising an exception.
+
+    A verdict is true if the value is valid.  Otherwise `error` is the
+    exception `validate` would have raised for the value.  It is only
+    created when it is asked for, as building it is the expensive part.
+
+    >>> bool(VALID), VALID.error
+    (True, None)
+    >>> verdict = Verdict(MessageValidationError, _bad_query)
+    >>> bool(verdict)
+    False
+    >>> verdict.error
+    MessageValidationError('Invalid query.', None)
+    >>> verdict.error is verdict.error
+    True
+
+    A verdict can also be created for an error which was already raised:
+
+    >>> error = ValidationError('Wrong!')
+    >>> Verdict.failed(error).error is error
+    True
+    """
+
+    __slots__ = ('_factory', '_args', '_error')
+
+    def __init__(self, factory=None, *args):
+        self._factory = factory
+        self._args = args
+        self._error = None
+
+    @classmethod
+    def failed(cls, error):
+        verdict = cls()
+        verdict._error = error
+        return verdict
+
+    def __bool__(self):
+        return self._factory is None and self._error is None
+
+    @property
+    def error(self):
+        if self._error is None and self._factory is not None:
+            self._error = self._factory(*self._args)
+        return self._error
+
+    def __repr__(self):
+        if self:
+            return '<Verdict valid>'
+        return '<Verdict %r>' % (self.error,)
+
+
+VALID = Verdict()
+
+
+def _requiredMissing(field, value):
+    return RequiredMissing(field.__name__).with_field_and_value(field, value)
+
+
+def _wrongType(field, value):
+    return WrongType(
+        value, field._type, field.__name__).with_field_and_value(field, value)
+
+
+def _checkRaising(validate, value):
+    """Return the verdict for a validation which can only report by raising.
+    """
+    try:
+        validate(value)
+    except StopValidation:
+        pass
+    except ValidationError as e:
+        return Verdict.failed(e)
+    return VALID
+
+
+class _ValidationScope(threading.local):
+    """The verdicts memoized during one top-level validation."""
+
+    verdicts = None
+    # The I/O-bound constraints left for `BaseField.validate_async`.
+    deferred = None
+
+
+_scope = _ValidationScope()
+
+# Types whose equal values are validated the same way.  Other values, like
+# 1 == 1.0 or datetimes in different time zones, may be equal even though a
+# field accepts only one of them.
+_MEMOIZED_TYPES = frozenset(
+    [str, bytes, int, float, bool, type(None), datetime.date])
+
+
+def _valueKey(value):
+    """Return a key for the value in the memoized verdicts, or None."""
+    cls = type(value)
+    if cls is tuple:
+        keys = []
+        for v in value:
+            key = _valueKey(v)
+            if key is None:
+                return None
+            keys.append(key)
+        return tuple, tuple(keys)
+    if cls in _MEMOIZED_TYPES:
+        return cls, value
+    return None
+
+
+def _memoizing(method):
+    """Memoize the verdicts of nested fields while the method runs.
+
+    Only the outermost call creates the scope, so a `Union` probing
+    `Combination` alternatives (or the reverse) checks each sub-value once
+    for each field.  Fields without `Union` or `Combination` members have
+    nothing to memoize, so they do not create a scope.
+    """
+    @functools.wraps(method)
+    def wrapper(self, value):
+        if not self._memoize or _scope.verdicts is not None:
+            return method(self, value)
+        _scope.verdicts = {}
+        try:
+            return method(self, value)
+        finally:
+            _scope.verdicts = None
+    return wrapper
+
+
+def _nests(fields):
+    """Tell whether some of the fields are `Union` or `Combination` fields.
+    """
+    return any(isinstance(f, (Union, Combination)) for f in fields)
+
+
+def _check(field, value):
+    check = getattr(field, 'check', None)
+    if check is None:
+        return _checkRaising(field.validate, value)
+    return check(value)
+
+
+def check(field, value):
+    """Return the `Verdict` of the field about the value.
+
+    Fields providing `check` are asked without raising an exception; for
+    other fields, like the ones of zope.schema, the exception raised by
+    `validate` is caught.
+
+    >>> check(schema.Int(), 1)
+    <Verdict valid>
+    >>> check(schema.Int(__name__='number'), u'1')
+    <Verdict WrongType('1', <class 'int'>, 'number')>
+    >>> check(Option(value=u'on'), u'on')
+    <Verdict valid>
+
+    During the validation of a `Union` or `Combination` the verdicts are
+    memoized for each field and value.
+    """
+    verdicts = _scope.verdicts
+    if verdicts is None:
+        return _check(field, value)
+    value_key = _valueKey(value)
+    if value_key is None:
+        return _check(field, value)
+    # Clones bound by `_bindField` share the field they were made from.
+    # Verdicts leaving out deferred constraints are kept apart.
+    key = (id(getattr(field, '_memo_token', field)), value_key,
+           _scope.deferred is None)
+    entry = verdicts.get(key)
+    if entry is None:
+        # The entry keeps the field alive, so its id is not reused meanwhile.
+        entry = verdicts[key] = (field, _check(field, value))
+    return entry[1]
+
+
+def _bindField(field, context):
+    """Bind a contained field, remembering the field the clone was made from.
+    """
+    clone = field.bind(context)
+    if getattr(clone, '_memo_token', None) is None:
+        clone._memo_token = field
+    return clone
+
+
+def validate_many(field, values):
+    """Validate a sequence of values with the given field.
+
+    Return a list of ``(index, error)`` pairs, one for each value which does
+    not validate, ordered by index.  Fields providing `validate_many` do the
+    whole batch; other fields get checked value by value.
+
+    >>> validate_many(schema.Int(__name__='number'), [1, u'2', 3, None])
+    [(1, WrongType('2', <class 'int'>, 'number')), (3, RequiredMissing('number'))]
+    """  # noqa
+    try:
+        many = field.validate_many
+    except AttributeError:
+        errors = []
+        for ix, value in enumerate(values):
+            verdict = check(field, value)
+            if not verdict:
+                errors.append((ix, verdict.error))
+        return errors
+    return many(values)
+
+
+def pure(constraint):
+    """Mark a constraint as a pure function of the value.
+
+    Fields cache the outcome of pure constraints, see `BaseField`.
+    """
+    constraint.pure = True
+    return constraint
+
+
+class _CachedError:
+    """An error kept in a cache, raised as a new exception each time.
+
+    Raising the same exception again would extend its traceback, keeping
+    the frames of every call alive as long as the cache entry.
+    """
+
+    __slots__ = ('cls', 'args', 'attributes')
+
+    def __init__(self, error):
+        self.cls = error.__class__
+        self.args = error.args
+        self.attributes = dict(error.__dict__)
+
+    def create(self):
+        error = self.cls.__new__(self.cls, *self.args)
+        error.args = self.args
+        error.__dict__.update(self.attributes)
+        return error
+
+
+def blocking(constraint):
+    """Mark a constraint as doing blocking I/O.
+
+    `BaseField.validate_async` runs blocking constraints in a thread pool.
+    """
+    constraint.blocking = True
+    return constraint
+
+
+def _isAsync(constraint):
+    return (inspect.iscoroutinefunction(constraint)
+            or inspect.iscoroutinefunction(
+                getattr(constraint, '__call__', None)))
+
+
+def _awaitsConstraints(field):
+    """Tell whether the field or its members have awaitable constraints."""
+    if any(_isAsync(c) for c in getattr(field, 'constraints', ())):
+        return True
+    if isinstance(field, (Union, Combination)):
+        return any(_awaitsConstraints(f) for f in field.fields)
+    return False
+
+
+def _isIO(constraint):
+    """Tell whether the constraint is awaitable or does blocking I/O."""
+    return getattr(constraint, 'blocking', False) or _isAsync(constraint)
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def _callIO(constraint, field, value):
+    """Call an I/O-bound constraint synchronously."""
+    result = constraint(field, value)
+    if not inspect.isawaitable(result):
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(_await(result))
+        return
+    # The loop of this thread is busy, so run the coroutine in another one.
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        executor.submit(asyncio.run, _await(result)).result()
+
+
+async def _runDeferred(deferred, executor):
+    """Run the deferred constraints concurrently.
+
+    Raise the error of the first failing constraint in the order they were
+    deferred, whichever fails first.
+    """
+    loop = asyncio.get_running_loop()
+    calls = []
+    for field, constraint, value in deferred:
+        if _isAsync(constraint):
+            calls.append(constraint(field, value))
+        else:
+            calls.append(loop.run_in_executor(
+                executor, _callIO, constraint, field, value))
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+class ConstraintStatistics:
+    """The cost and failure rate recorded for the constraints of a field.
+
+    The constraints are ordered by their mean time divided by their failure
+    rate, so cheap constraints which often fail run first.  Constraints which
+    never failed run last, the cheaper ones first.
+
+    >>> def cheap(field, value):
+    ...     pass
+    >>> def fails(field, value):
+    ...     pass
+    >>> statistics = ConstraintStatistics((cheap, fails), reorder_interval=4)
+    >>> statistics.order
+    (0, 1)
+    >>> for failed in (False, True, False, True):
+    ...     statistics.record(0, 0.002, False)
+    ...     statistics.record(1, 0.001, failed)
+    >>> statistics.order
+    (1, 0)
+    >>> for info in statistics.report():
+    ...     print(info['constraint'].__name__, info['calls'], info['failures'],
+    ...           info['failure_rate'], round(info['mean_time'], 3))
+    cheap 4 0 0.0 0.002
+    fails 4 2 0.5 0.001
+    """
+
+    def __init__(self, constraints, reorder_interval=100):
+        self.constraints = constraints
+        self.reorder_interval = reorder_interval
+        self.calls = [0] * len(constraints)
+        self.failures = [0] * len(constraints)
+        self.time = [0.0] * len(constraints)
+        self.order = tuple(range(len(constraints)))
+        self._recorded = 0
+
+    def record(self, ix, elapsed, failed):
+        self.calls[ix] += 1
+        self.time[ix] += elapsed
+        if failed:
+            self.failures[ix] += 1
+        self._recorded += 1
+        if self._recorded >= self.reorder_interval:
+            self._recorded = 0
+            self.reorder()
+
+    def _rank(self, ix):
+        calls = self.calls[ix]
+        if not calls:
+            return (0, 0.0, ix)  # try unknown constraints first
+        mean_time = self.time[ix] / calls
+        if not self.failures[ix]:
+            return (2, mean_time, ix)
+        return (1, mean_time * calls / self.failures[ix], ix)
+
+    def reorder(self):
+        self.order = tuple(sorted(range(len(self.constraints)),
+                                  key=self._rank))
+
+    def report(self):
+        """Return the statistics of each constraint in declaration order."""
+        return [
+            {'constraint': constraint,
+             'calls': self.calls[ix],
+             'failures': self.failures[ix],
+             'failure_rate': (
+                 self.failures[ix] / self.calls[ix] if self.calls[ix]
+                 else 0.0),
+             'mean_time': (
+                 self.time[ix] / self.calls[ix] if self.calls[ix] else 0.0)}
+            for ix, constraint in enumerate(self.constraints)]
+
+
 @interface.implementer(interfaces.IExtendedField)
 class BaseField(schema.Field):
     """Field with a callable as default and a tuple of constraints.
@@ -86,6 +512,136 @@ class BaseField(schema.Field):
     Traceback (most recent call last):
     ...
     ValidationError: Password too short.
+
+    A `default_getter` is called each time the default is asked for.  With
+    `cache_default` its result is computed once for each context during a
+    request:
+
+    >>> calls = []
+    >>> def expensive_default(context):
+    ...     calls.append(context)
+    ...     return u'computed for %s' % context
+    >>> f = BaseField(default_getter=expensive_default, cache_default=True)
+    >>> import zope.security.management
+    >>> from zope.publisher.browser import TestRequest
+    >>> zope.security.management.newInteraction(TestRequest())
+    >>> print(f.bind('a').default)
+    computed for a
+    >>> print(f.bind('a').default)
+    computed for a
+    >>> print(f.bind('b').default)
+    computed for b
+    >>> calls
+    ['a', 'b']
+
+    The cached defaults can be invalidated for one or for all contexts:
+
+    >>> f.invalidateDefault('a')
+    >>> print(f.bind('a').default)
+    computed for a
+    >>> print(f.bind('b').default)
+    computed for b
+    >>> calls
+    ['a', 'b', 'a']
+    >>> f.invalidateDefault()
+    >>> print(f.bind('b').default)
+    computed for b
+    >>> calls
+    ['a', 'b', 'a', 'b']
+
+    Each request starts afresh; outside of a request nothing is cached:
+
+    >>> zope.security.management.endInteraction()
+    >>> print(f.bind('a').default)
+    computed for a
+    >>> print(f.bind('a').default)
+    computed for a
+    >>> calls
+    ['a', 'b', 'a', 'b', 'a', 'a']
+
+    With `adaptive_constraints` the field records the cost and the failure
+    rate of its constraints and runs the cheap constraints which often fail
+    first.  The error reported is still the one of the first failing
+    constraint in declaration order:
+
+    >>> def slow_check(field, value):
+    ...     if value == u'slow':
+    ...         raise schema.ValidationError('Slow check failed.')
+    >>> def quick_check(field, value):
+    ...     if value.startswith(u's'):
+    ...         raise schema.ValidationError('Quick check failed.')
+    >>> f = BaseField(constraints=(slow_check, quick_check),
+    ...               adaptive_constraints=True)
+    >>> f.constraint_statistics.order = (1, 0)
+    >>> f.validate(u'slow')
+    Traceback (most recent call last):
+    ...
+    ValidationError: Slow check failed.
+    >>> f.validate(u'sloth')
+    Traceback (most recent call last):
+    ...
+    ValidationError: Quick check failed.
+    >>> f.validate(u'fast')
+    >>> for info in f.getConstraintStatistics():
+    ...     print(info['constraint'].__name__, info['calls'], info['failures'])
+    slow_check 3 1
+    quick_check 3 2
+    >>> BaseField().getConstraintStatistics() is None
+    True
+
+    Constraints which are pure functions of the value can be marked with
+    `pure`.  The field caches their outcome, passing or the error, for the
+    last `constraint_cache_size` values:
+
+    >>> calls = []
+    >>> @pure
+    ... def checksum(field, value):
+    ...     calls.append(value)
+    ...     if sum(map(ord, value)) % 2:
+    ...         raise schema.ValidationError('Bad checksum.')
+    >>> f = BaseField(constraints=(checksum,), constraint_cache_size=2)
+    >>> f.validate(u'ab')
+    Traceback (most recent call last):
+    ...
+    ValidationError: Bad checksum.
+    >>> f.validate(u'ab')
+    Traceback (most recent call last):
+    ...
+    ValidationError: Bad checksum.
+    >>> f.validate(u'ac')
+    >>> f.bind(object()).validate(u'ac')
+    >>> calls
+    ['ab', 'ac']
+    >>> f.validate(u'ae')
+    >>> f.validate(u'ab')
+    Traceback (most recent call last):
+    ...
+    ValidationError: Bad checksum.
+    >>> calls
+    ['ab', 'ac', 'ae', 'ab']
+    >>> sorted(f.getConstraintCacheStatistics().items())
+    [('evictions', 2), ('hits', 2), ('maxsize', 2), ('misses', 4), ('size', 2)]
+    >>> BaseField().getConstraintCacheStatistics() is None
+    True
+
+    Each hit raises a new error, so no traceback accumulates in the cache:
+
+    >>> errors = []
+    >>> for i in range(2):
+    ...     try:
+    ...         f.validate(u'ab')
+    ...     except schema.ValidationError as e:
+    ...         errors.append(e)
+    >>> errors[0] is errors[1], errors[0].args == errors[1].args
+    (False, True)
+
+    Copies of the field start with an empty cache:
+
+    >>> import copy
+    >>> clone = copy.deepcopy(f)
+    >>> sorted(clone.getConstraintCacheStatistics().items())
+    [('evictions', 0), ('hits', 0), ('maxsize', 2), ('misses', 0), ('size', 0)]
+
     >>> class IDummy2(interface.Interface):
     ...     invalid_default = BaseField(
     ...         title=u'Field with invalid default',
@@ -97,28 +653,265 @@ class BaseField(schema.Field):
     """
     constraints = ()
     _default = default_getter = None
-
-    def __init__(self, constraints=(), default_getter=None, **kw):
+    cache_default = False
+    constraint_statistics = None
+    constraint_cache = None
+    io_constraints = False
+
+    def __init__(self, constraints=(), default_getter=None,
+                 cache_default=False, adaptive_constraints=False,
+                 constraint_cache_size=128, **kw):
         self.constraints = constraints
+        if adaptive_constraints:
+            self.constraint_statistics = ConstraintStatistics(constraints)
+        if any(getattr(c, 'pure', False) for c in constraints):
+            self.constraint_cache = LRUCache(constraint_cache_size)
+        if any(_isIO(c) for c in constraints):
+            self.io_constraints = True
         if default_getter is not None and 'default' in kw:
             raise TypeError(
                 'may not specify both a default and a default_getter')
         super().__init__(**kw)
         self.default_getter = default_getter
+        self.cache_default = cache_default
 
     def _validate(self, value):
         super()._validate(value)
         if value != self.missing_value:
-            for constraint in self.constraints:
+            self._runConstraints(value)
+
+    def _runConstraints(self, value):
+        statistics = self.constraint_statistics
+        if statistics is None:
+            if self.constraint_cache is None and not self.io_constraints:
+                for constraint in self.constraints:
+                    constraint(self, value)
+            else:
+                for constraint in self.constraints:
+                    self._callConstraint(constraint, value)
+            return
+        constraints = self.constraints
+        if statistics.constraints is not constraints:
+            statistics = self.constraint_statistics = ConstraintStatistics(
+                constraints, statistics.reorder_interval)
+        order = statistics.order
+        for pos, ix in enumerate(order):
+            try:
+                self._runConstraint(statistics, ix, value)
+            except Exception:
+                # Report the error of the first failing constraint in
+                # declaration order, like running them in that order does.
+                done = order[:pos]
+                for earlier in range(ix):
+                    if earlier not in done:
+                        self._runConstraint(statistics, earlier, value)
+                raise
+
+    def _runConstraint(self, statistics, ix, value):
+        start = time.perf_counter()
+        try:
+            self._callConstraint(statistics.constraints[ix], value)
+        except Exception:
+            statistics.record(ix, time.perf_counter() - start, True)
+            raise
+        statistics.record(ix, time.perf_counter() - start, False)
+
+    def _callConstraint(self, constraint, value):
+        if self.io_constraints and _isIO(constraint):
+            deferred = _scope.deferred
+            if deferred is None:
+                _callIO(constraint, self, value)
+            else:
+                deferred.append((self, constraint, value))
+            return
+        cache = self.constraint_cache
+        if cache is None or not getattr(constraint, 'pure', False):
+            constraint(self, value)
+            return
+        value_key = _valueKey(value)
+        if value_key is None:
+            constraint(self, value)
+            return
+        key = id(constraint), value_key
+        outcome = cache.get(key, _marker)
+        if outcome is _marker:
+            try:
                 constraint(self, value)
+            except ValidationError as e:
+                cache.set(key, _CachedError(e))
+                raise
+            cache.set(key, None)
+        elif outcome is not None:
+            raise outcome.create()
+
+    async def validate_async(self, value, executor=None):
+        """Validate the value, running I/O-bound constraints concurrently.
+
+        Constraints which are coroutine functions or are marked as
+        `blocking` are collected while the other checks run.  They are then
+        awaited together, the blocking ones in the `executor` (the default
+        executor of the loop if None).  The error raised is the one
+        `validate` would raise: when another check fails, the I/O-bound
+        constraints collected before it still run, and the first of them
+        which fails comes first.
+
+        >>> import asyncio
+        >>> barrier = threading.Barrier(2, timeout=10)
+        >>> @blocking
+        ... def registered(field, value):
+        ...     barrier.wait()  # only passes if both run at the same time
+        ...     if value == u'unknown':
+        ...         raise schema.ValidationError('Not registered.')
+        >>> async def available(field, value):
+        ...     await asyncio.sleep(0)
+        ...     if value == u'taken':
+        ...         raise schema.ValidationError('Taken.')
+        >>> account = Combination(
+        ...     (TextLine(constraints=(registered, available)),
+        ...      TextLine(constraints=(registered, available))))
+        >>> asyncio.run(account.validate_async((u'joe', u'jane')))
+        >>> asyncio.run(account.validate_async((u'taken', u'unknown')))
+        Traceback (most recent call last):
+        ...
+        ValidationError: Taken.
+
+        `validate` calls the same constraints one after the other:
+
+        >>> barrier = threading.Barrier(1)
+        >>> account.validate((u'joe', u'taken'))
+        Traceback (most recent call last):
+        ...
+        ValidationError: Taken.
+
+        When an I/O-bound constraint and a later check both fail, the error
+        of the I/O-bound constraint is raised, as with `validate`:
+
+        >>> def short(field, value):
+        ...     if len(value) < 6:
+        ...         raise schema.ValidationError('Too short.')
+        >>> name = TextLine(constraints=(available, short))
+        >>> asyncio.run(name.validate_async(u'taken'))
+        Traceback (most recent call last):
+        ...
+        ValidationError: Taken.
+        >>> name.validate(u'taken')
+        Traceback (most recent call last):
+        ...
+        ValidationError: Taken.
+        >>> asyncio.run(name.validate_async(u'tiny'))
+        Traceback (most recent call last):
+        ...
+        ValidationError: Too short.
+        >>> asyncio.run(Combination((name, name)).validate_async(
+        ...     (u'taken', u'tiny')))
+        Traceback (most recent call last):
+        ...
+        ValidationError: Taken.
+
+        Choosing the field of a `Union` needs the outcome of the constraints
+        of the unioned fields, so their blocking constraints run while the
+        union probes them, in the thread of the loop.  Awaiting a
+        constraint there would block the loop as well, so unioned fields
+        may not have awaitable constraints:
+
+        >>> Union((schema.Int(), Combination((name, name))))
+        Traceback (most recent call last):
+        ...
+        ValueError: unioned fields may not have awaitable constraints
+        >>> calls = []
+        >>> @blocking
+        ... def known(field, value):
+        ...     calls.append(threading.current_thread())
+        >>> choice = Union((schema.Int(), TextLine(constraints=(known,))))
+        >>> asyncio.run(choice.validate_async(u'joe'))
+        >>> calls == [threading.current_thread()]
+        True
+        """
+        deferred = []
+        previous = _scope.deferred
+        _scope.deferred = deferred
+        try:
+            self.validate(value)
+        except Exception as e:
+            # The constraints deferred so far come before the failing check.
+            error = e
+        else:
+            error = None
+        finally:
+            _scope.deferred = previous
+        if deferred:
+            await _runDeferred(deferred, executor)
+        if error is not None:
+            raise error
+
+    def getConstraintCacheStatistics(self):
+        """Return the counters of the cache of pure constraints, or None."""
+        if self.constraint_cache is None:
+            return None
+        return self.constraint_cache.statistics()
+
+    def getConstraintStatistics(self):
+        """Return the statistics recorded for each constraint, or None."""
+        if self.constraint_statistics is None:
+            return None
+        return self.constraint_statistics.report()
+
+    def check(self, value):
+        """Return the `Verdict` about the value without raising.
+
+        Missing and wrongly typed values are rejected without creating an
+        exception.
+        """
+        if value == self.missing_value:
+            if self.required:
+                return Verdict(_requiredMissing, self, value)
+            return VALID
+        if self._type is not None and not isinstance(value, self._type):
+            return Verdict(_wrongType, self, value)
+        return _checkRaising(self._validate, value)
+
+    def validate_many(self, values):
+        """Validate a sequence of values in one call.
+
+        Return a list of ``(index, error)`` pairs, one for each value which
+        does not validate, ordered by index.  Validation does not stop at
+        the first invalid value.
+
+        Constraints providing ``prefetch(field, values)``, a context
+        manager, can look up what they need for the whole batch first.
+        """
+        errors = []
+        check = self.check
+        with contextlib.ExitStack() as stack:
+            for constraint in self.constraints:
+                prefetch = getattr(constraint, 'prefetch', None)
+                if prefetch is not None:
+                    if not isinstance(values, (list, tuple)):
+                        values = list(values)
+                    stack.enter_context(prefetch(self, values))
+            for ix, value in enumerate(values):
+                verdict = check(value)
+                if not verdict:
+                    errors.append((ix, verdict.error))
+        return errors
 
     @property
     def default(self):
         if self.default_getter is not None:
+            if self.cache_default:
+                return _computeCached(self.default_getter, self.context)
             return self.default_getter(self.context)
         else:
             return self._default
 
+    def invalidateDefault(self, context=None):
+        """Forget the default computed for the context during the request.
+
+        Forget the defaults computed for all contexts if `context` is None.
+        """
+        if self.default_getter is not None:
+            _invalidateCached(self.default_getter, context)
+
     @default.setter
     def default(self, value):
         assert self.default_getter is None
@@ -127,13 +920,41 @@ class BaseField(schema.Field):
 
 @interface.implementer(interfaces.IOptionField)
 class Option(BaseField):
-    """A field with one predefined value."""
+    """A field with one predefined value.
+
+    The value may be computed by a `value_getter`.  With `cache_value` it is
+    computed once for each context during a request, as a `Union` asks
+    for it whenever it probes the option:
+
+    >>> calls = []
+    >>> def value_getter(context):
+    ...     calls.append(context)
+    ...     return u'no change'
+    >>> f = Union((
+    ...     schema.Int(title=u'Number'),
+    ...     Option(value_getter=value_getter, cache_value=True)))
+    >>> import zope.security.management
+    >>> from zope.publisher.browser import TestRequest
+    >>> zope.security.management.newInteraction(TestRequest())
+    >>> f.validate(u'no change')
+    >>> f.validate(u'no change')
+    >>> calls
+    [None]
+    >>> f.fields[1].invalidateValue()
+    >>> f.validate(u'no change')
+    >>> calls
+    [None, None]
+    >>> zope.security.management.endInteraction()
+    """
+
+    cache_value = False
 
     def __init__(self, value=None, value_getter=None,
-                 identity_comparison=False, **kw):
+                 identity_comparison=False, cache_value=False, **kw):
         self.value = value
         self.value_getter = value_getter
         self.identity_comparison = identity_comparison
+        self.cache_value = cache_value
         assert (value is None) ^ (value_getter is None)
         assert not kw.get('required')
         kw['required'] = False
@@ -147,12 +968,31 @@ class Option(BaseField):
             elif self.getValue() != value:
                 raise WrongType
 
+    def check(self, value):
+        if value != self.missing_value:
+            if self.identity_comparison:
+                if self.getValue() is not value:
+                    return Verdict(WrongType)
+            elif self.getValue() != value:
+                return Verdict(WrongType)
+        return VALID
+
     def getValue(self):
         if self.value_getter is not None:
+            if self.cache_value:
+                return _computeCached(self.value_getter, self.context)
             return self.value_getter(self.context)
         else:
             return self.value
 
+    def invalidateValue(self, context=None):
+        """Forget the value computed for the context during the request.
+
+        Forget the values computed for all contexts if `context` is None.
+        """
+        if self.value_getter is not None:
+            _invalidateCached(self.value_getter, context)
+
 
 @interface.implementer(interfaces.IUnionField)
 class Union(BaseField):
@@ -244,9 +1084,79 @@ class Union(BaseField):
     True
     >>> bound_f.fields[1].context is context
     True
+
+    Only fields which can accept the type of a value are tried.  The
+    candidates for a type are computed once and keep the order of the
+    fields; fields which do not declare a type, like `Option`, are always
+    tried:
+
+    >>> f = Union((
+    ...     schema.Int(title=u'Number'),
+    ...     Option(title=u'Unknown', value=u'unknown'),
+    ...     schema.TextLine(title=u'Text')), title=u'Mixed')
+    >>> list(f._candidates(42))
+    [0, 1]
+    >>> list(f._candidates(u'unknown'))
+    [1, 2]
+    >>> f.validField(u'unknown') is f.fields[1]
+    True
+    >>> f.validField(u'other') is f.fields[2]
+    True
+    >>> f.validFieldIndex(u'other')
+    2
+    >>> f.validFieldIndex(1.5) is None
+    True
+    >>> f.validField(42) is f.fields[0]
+    True
+    >>> f.validField(4.2) is None
+    True
+
+    A value equal to the missing value of a field validates if that field is
+    not required, whatever the type of the field is, so all fields are tried
+    for it:
+
+    >>> f = Union((
+    ...     schema.Int(title=u'Number', required=False),
+    ...     schema.TextLine(title=u'Text')), title=u'Mixed')
+    >>> list(f._candidates(None))
+    [0, 1]
+    >>> f.validField(None) is f.fields[0]
+    True
+
+    The candidates are left out of pickles and copies and computed again
+    when needed:
+
+    >>> import pickle
+    >>> clone = pickle.loads(pickle.dumps(f))
+    >>> '_dispatch' in clone.__dict__, '_types' in clone.__dict__
+    (False, False)
+    >>> clone.validField(u'other') is clone.fields[1]
+    True
+
+    `check` tells whether a value validates without raising an exception;
+    the unioned fields are probed the same way:
+
+    >>> f.check(42)
+    <Verdict valid>
+    >>> verdict = f.check(4.2)
+    >>> bool(verdict)
+    False
+    >>> verdict.error
+    MessageValidationError('No unioned field validates ${value}.', {'value': 4.2})
+
+    `validate_many` validates a whole sequence of values.  It reports the
+    index and the error of every value which does not validate:
+
+    >>> f.validate_many([1, u'one', 4.2, None, 2, b'two'])
+    [(2, MessageValidationError('No unioned field validates ${value}.', {'value': 4.2})),
+     (3, RequiredMissing('')),
+     (5, MessageValidationError('No unioned field validates ${value}.', {'value': b'two'}))]
     """  # noqa
     fields = ()
     use_default_for_not_selected = False
+    _dispatch = None
+    # Whether to memoize verdicts, see `_memoizing`.
+    _memoize = True
 
     def __init__(self, fields, use_default_for_not_selected=False, **kw):
         if len(fields) < 2:
@@ -254,32 +1164,182 @@ class Union(BaseField):
         for ix, field in enumerate(fields):
             if not IField.providedBy(field):
                 raise DoesNotImplement(IField)
+            if _awaitsConstraints(field):
+                # Choosing a field cannot await them, see `validate_async`.
+                raise ValueError(
+                    _("unioned fields may not have awaitable constraints"))
             field.__name__ = "unioned_%02d" % ix
         self.fields = tuple(fields)
+        self._memoize = _nests(self.fields)
         self.use_default_for_not_selected = use_default_for_not_selected
+        self._initDispatch()
         super().__init__(**kw)
 
+    def _initDispatch(self):
+        # Python type -> (indexes of candidate fields, indexes of fields
+        # whose type does not accept the value); filled in lazily.
+        self._dispatch = {}
+        self._types = tuple(getattr(f, '_type', None) for f in self.fields)
+
+    def _candidates(self, value):
+        """Return the indexes of the fields which may validate the value.
+
+        Fields which declare a `_type` the value is not an instance of are
+        skipped, unless the value is their missing value.  Fields without a
+        declared type are always candidates.  The order of the fields is
+        kept.
+        """
+        if self._dispatch is None:
+            self._initDispatch()  # unpickled or created by an older version
+        cls = type(value)
+        try:
+            candidates, skipped = self._dispatch[cls]
+        except KeyError:
+            candidates = []
+            skipped = []
+            for ix, type_ in enumerate(self._types):
+                if type_ is None or isinstance(value, type_):
+                    candidates.append(ix)
+                else:
+                    skipped.append(ix)
+            candidates = tuple(candidates)
+            skipped = tuple(skipped)
+            # Proxies pretend to be of another class, so isinstance() does not
+            # depend on the type alone for them.
+            if value.__class__ is cls:
+                self._dispatch[cls] = candidates, skipped
+        if skipped:
+            fields = self.fields
+            for ix in skipped:
+                if value == fields[ix].missing_value:
+                    return range(len(fields))
+        return candidates
+
+    # The candidates are left out of pickles and copies.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_dispatch', None)
+        state.pop('_types', None)
+        return state
+
     def bind(self, object):
         clone = super().bind(object)
         # We need to bind the fields too, e.g. for Choice fields
-        clone.fields = tuple(field.bind(object) for field in clone.fields)
+        clone.fields = tuple(
+            _bindField(field, object) for field in clone.fields)
         return clone
 
     def validField(self, value):
         """Return first valid field, or None."""
-        for field in self.fields:
+        ix = self.validFieldIndex(value)
+        if ix is not None:
+            return self.fields[ix]
+
+    def validFieldIndex(self, value):
+        """Return the index of the first valid field, or None."""
+        deferred = _scope.deferred
+        if deferred is not None:
+            # Choosing a field needs the outcome of all its constraints.
+            _scope.deferred = None
             try:
-                field.validate(value)
-            except ValidationError:
-                pass
-            else:
-                return field
+                return self._validFieldIndex(value)
+            finally:
+                _scope.deferred = deferred
+        return self._validFieldIndex(value)
+
+    def _validFieldIndex(self, value):
+        fields = self.fields
+        probe = _check if _scope.verdicts is None else check
+        for ix in self._candidates(value):
+            if probe(fields[ix], value):
+                return ix
 
     def _validate(self, value):
         if self.validField(value) is None:
             raise MessageValidationError(_no_unioned_field_validates,
                                          {'value': value})
 
+    validate = _memoizing(BaseField.validate)
+
+    @_memoizing
+    def check(self, value):
+        if value == self.missing_value:
+            if self.required:
+                return Verdict(_requiredMissing, self, value)
+            return VALID
+        if self.validField(value) is None:
+            return Verdict(MessageValidationError,
+                           _no_unioned_field_validates, {'value': value})
+        return VALID
+
+    def validate_many(self, values):
+        # Probe the unioned fields one after the other with all the values
+        # not validated by a previous field, so each field validates a batch.
+        values = list(values)
+        missing_value = self.missing_value
+        errors = []
+        remaining = []
+        candidates = {}
+        for ix, value in enumerate(values):
+            if value == missing_value:
+                if self.required:
+                    errors.append((ix, _requiredMissing(self, value)))
+            else:
+                remaining.append(ix)
+                candidates[ix] = self._candidates(value)
+        for field_ix, field in enumerate(self.fields):
+            probe = [ix for ix in remaining if field_ix in candidates[ix]]
+            if not probe:
+                continue
+            failed = {probe[pos] for pos, error in validate_many(
+                field, [values[ix] for ix in probe])}
+            valid = set(probe).difference(failed)
+            remaining = [ix for ix in remaining if ix not in valid]
+            if not remaining:
+                break
+        errors.extend(
+            (ix, MessageValidationError(
+                _no_unioned_field_validates, {'value': values[ix]}))
+            for ix in remaining)
+        errors.sort(key=lambda error: error[0])
+        return errors
+
+
+def _missingMask(column, missing_value):
+    """Return a boolean array telling which entries of a column are missing.
+
+    NaT and NaN stand for the missing value, as do entries equal to the
+    missing value of the field.
+    """
+    kind = column.dtype.kind
+    if kind in 'mM':
+        mask = numpy.isnat(column)
+    elif kind in 'fc':
+        mask = numpy.isnan(column)
+    else:
+        mask = numpy.zeros(len(column), dtype=bool)
+    if kind == 'O' or missing_value is not None:
+        mask |= numpy.asarray(column == missing_value, dtype=bool)
+    return mask
+
+
+# Units of datetime64 values for which `item` returns an integer.
+_FINE_UNITS = frozenset(['ns', 'ps', 'fs', 'as'])
+
+
+def _scalar(value, dates=False):
+    """Convert a NumPy scalar to the corresponding Python object.
+
+    datetime64 values become dates if `dates` is true, datetimes otherwise.
+    """
+    if numpy is not None and isinstance(value, numpy.datetime64):
+        if dates:
+            value = value.astype('datetime64[D]')
+        elif numpy.datetime_data(value.dtype)[0] in _FINE_UNITS:
+            value = value.astype('datetime64[us]')
+    item = getattr(value, 'item', None)
+    return value if item is None else item()
+
 
 class OrderedCombinationConstraint:
 
@@ -287,6 +1347,70 @@ class OrderedCombinationConstraint:
         self.may_be_equal = may_be_equal
         self.decreasing = decreasing
 
+    def _vectorized(self, field, columns):
+        if numpy is None:
+            raise RuntimeError(
+                'Vectorized validation needs NumPy: install zc.form[numpy].')
+        columns = [numpy.asarray(column) for column in columns]
+        if len(columns) != len(field.fields):
+            raise ValueError('Expected one column for each field.')
+        size = len(columns[0])
+        try:
+            dtype = numpy.result_type(*columns)
+        except TypeError:
+            dtype = object
+        last = numpy.zeros(size, dtype=dtype)
+        minimum = numpy.zeros(size, dtype=dtype)
+        maximum = numpy.zeros(size, dtype=dtype)
+        has_last = numpy.zeros(size, dtype=bool)
+        violated = numpy.zeros(size, dtype=bool)
+        for column, f in zip(columns, field.fields):
+            present = ~_missingMask(column, f.missing_value)
+            rows = numpy.flatnonzero(present & has_last & ~violated)
+            v = column[rows]
+            previous = last[rows]
+            if self.decreasing:
+                bad = v > previous if self.may_be_equal else v >= previous
+                minimum[rows[bad]] = v[bad]
+                maximum[rows[bad]] = previous[bad]
+            else:
+                bad = v < previous if self.may_be_equal else v <= previous
+                minimum[rows[bad]] = previous[bad]
+                maximum[rows[bad]] = v[bad]
+            violated[rows[bad]] = True
+            last[present] = column[present]
+            has_last |= present
+        return violated, minimum, maximum
+
+    def violations(self, field, columns):
+        """Return a boolean array flagging the rows violating the constraint.
+
+        `columns` holds one array (or sequence) per field of the combination,
+        so row ``i`` is ``(columns[0][i], columns[1][i], ...)``.  NaT and NaN
+        entries stand for missing values.  Needs NumPy.
+        """
+        return self._vectorized(field, columns)[0]
+
+    def errors(self, field, columns):
+        """Return ``(row, error)`` pairs for the rows violating the constraint.
+
+        The error of a row is the one calling the constraint with the row
+        raises.  Needs NumPy.
+        """
+        violated, minimum, maximum = self._vectorized(field, columns)
+        if self.may_be_equal:
+            message = _range_less_equal_error
+        else:
+            message = _range_less_error
+        # The values of Date fields are dates, whatever the datetime64 unit.
+        dates = all(getattr(f, '_type', None) is datetime.date
+                    for f in field.fields)
+        return [
+            (int(row), MessageValidationError(
+                message, {'minimum': _scalar(minimum[row], dates),
+                          'maximum': _scalar(maximum[row], dates)}))
+            for row in numpy.flatnonzero(violated)]
+
     def __call__(self, field, value):
         # can assume that len(value) == len(field.fields)
         last = None
@@ -386,6 +1510,80 @@ class Combination(BaseField):
     >>> bound_f.fields[1].context is context
     True
 
+    Validating against a bound field reuses the contained fields bound by
+    `bind`, so no new field objects get created.  We count the fields
+    allocated by binding to show this:
+
+    >>> class CountingDate(schema.Date):
+    ...     allocated = 0
+    ...     def bind(self, context):
+    ...         CountingDate.allocated += 1
+    ...         return super().bind(context)
+    >>> class IDemo3(interface.Interface):
+    ...     range = Combination(
+    ...         (CountingDate(title=u'Begin'), CountingDate(title=u'End')),
+    ...         title=u'Range')
+    >>> value = (datetime.date(2005, 6, 22), datetime.date(2005, 7, 10))
+    >>> bound_f = IDemo3['range'].bind(context)
+    >>> CountingDate.allocated
+    2
+    >>> for i in range(1000):
+    ...     bound_f.validate(value)
+    >>> CountingDate.allocated
+    2
+
+    Before, every call to `validate` bound both fields again, allocating 2000
+    field objects for the loop above.  An unbound field binds its fields once
+    for the context (`None` here) and reuses them as well:
+
+    >>> for i in range(1000):
+    ...     IDemo3['range'].validate(value)
+    >>> CountingDate.allocated
+    4
+
+    The bound fields are left out of pickles and copies, with the context
+    they were bound to, and bound again when needed:
+
+    >>> import copy
+    >>> '_bound_fields' in IDemo3['range'].__dict__
+    True
+    >>> clone = copy.deepcopy(IDemo3['range'])
+    >>> '_bound_fields' in clone.__dict__
+    False
+    >>> clone.validate(value)
+    >>> CountingDate.allocated
+    6
+
+    `check` returns a `Verdict` instead of raising; the error is the one
+    `validate` raises:
+
+    >>> f.check((None, datetime.date(2005, 7, 10)))
+    <Verdict valid>
+    >>> f.check(17)
+    <Verdict MessageValidationError('The value is not a sequence', None)>
+    >>> f.check((datetime.date(2005, 6, 22), None))
+    <Verdict RequiredMissing('combination_01')>
+    >>> f.check((datetime.date(2005, 6, 22), datetime.date(1995, 7, 10)))
+    ... # doctest: +ELLIPSIS
+    <Verdict MessageValidationError('${minimum} must be less than or equal...
+
+    `validate_many` validates a sequence of values in one call and reports
+    the errors of all invalid values together with their index:
+
+    >>> errors = f.validate_many([
+    ...     (datetime.date(2005, 6, 22), datetime.date(2005, 7, 10)),
+    ...     17,
+    ...     (datetime.date(2005, 6, 22), None),
+    ...     (None, datetime.date(2005, 7, 10)),
+    ...     (datetime.date(2005, 6, 22), datetime.date(1995, 7, 10)),
+    ...     ('foo', datetime.date(2005, 6, 22))])
+    >>> for ix, error in errors:
+    ...     print(ix, repr(error)) # doctest: +ELLIPSIS
+    1 MessageValidationError('The value is not a sequence', None)
+    2 RequiredMissing('combination_01')
+    4 MessageValidationError('${minimum} must be less than or equal ...)
+    5 WrongType('foo', <class 'datetime.date'>, 'combination_00')
+
     Each entry in the combination has to be a schema field
 
     >>> class IDemo2(interface.Interface):
@@ -398,6 +1596,9 @@ class Combination(BaseField):
     DoesNotImplement: An object does not implement interface...
     """
     fields = constraints = ()
+    _bound_fields = None
+    # Whether to memoize verdicts, see `_memoizing`.
+    _memoize = True
 
     def __init__(self, fields, **kw):
         for ix, field in enumerate(fields):
@@ -405,6 +1606,7 @@ class Combination(BaseField):
                 raise DoesNotImplement(IField)
             field.__name__ = "combination_%02d" % ix
         self.fields = tuple(fields)
+        self._memoize = _nests(self.fields)
         super().__init__(**kw)
 
     def _validate(self, value):
@@ -417,25 +1619,271 @@ class Combination(BaseField):
             if len_value != len(self.fields):
                 raise MessageValidationError(
                     _combination_wrong_size_error)
-            for v, f in zip(value, self.fields):
-                f = f.bind(self.context)
-                f.validate(v)
+            if _scope.verdicts is None:
+                for v, f in zip(value, self._getBoundFields()):
+                    f.validate(v)
+            else:
+                for v, f in zip(value, self._getBoundFields()):
+                    verdict = check(f, v)
+                    if not verdict:
+                        raise verdict.error
         super()._validate(value)
 
+    validate = _memoizing(BaseField.validate)
+
+    @_memoizing
+    def check(self, value):
+        if value == self.missing_value:
+            if self.required:
+                return Verdict(_requiredMissing, self, value)
+            return VALID
+        try:
+            len_value = len(value)
+        except (TypeError, AttributeError):
+            return Verdict(MessageValidationError,
+                           _combination_not_a_sequence_error)
+        if len_value != len(self.fields):
+            return Verdict(MessageValidationError,
+                           _combination_wrong_size_error)
+        for v, f in zip(value, self._getBoundFields()):
+            verdict = check(f, v)
+            if not verdict:
+                return verdict
+        return _checkRaising(super()._validate, value)
+
+    def validate_many(self, values):
+        # Validate the values column by column, so that each contained field
+        # validates a batch, then apply the constraints to the rows left.
+        missing_value = self.missing_value
+        size = len(self.fields)
+        errors = {}
+        rows = {}
+        for ix, value in enumerate(values):
+            if value == missing_value:
+                if self.required:
+                    errors[ix] = _requiredMissing(self, value)
+                continue
+            try:
+                len_value = len(value)
+            except (TypeError, AttributeError):
+                errors[ix] = MessageValidationError(
+                    _combination_not_a_sequence_error)
+                continue
+            if len_value != size:
+                errors[ix] = MessageValidationError(
+                    _combination_wrong_size_error)
+                continue
+            rows[ix] = (value, tuple(value))
+        for pos, field in enumerate(self._getBoundFields()):
+            alive = list(rows)
+            for col_ix, error in validate_many(
+                    field, [rows[ix][1][pos] for ix in alive]):
+                ix = alive[col_ix]
+                errors[ix] = error
+                del rows[ix]
+        validate = super()._validate
+        for ix, (value, members) in rows.items():
+            verdict = _checkRaising(validate, value)
+            if not verdict:
+                errors[ix] = verdict.error
+        return sorted(errors.items(), key=lambda error: error[0])
+
+    def _getBoundFields(self):
+        """Return the contained fields bound to the context of this field.
+
+        The bound fields are remembered together with the context they were
+        bound to, so that they are only created again when the context
+        changes.
+        """
+        context = self.context
+        bound = self._bound_fields
+        if bound is None or bound[0] is not context:
+            bound = (context,
+                     tuple(_bindField(f, context) for f in self.fields))
+            self._bound_fields = bound
+        return bound[1]
+
+    # The bound fields are left out of pickles and copies.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_bound_fields', None)
+        return state
+
     def bind(self, object):
         clone = super().bind(object)
         # We need to bind the fields too, e.g. for Choice fields
-        clone.fields = tuple(field.bind(object) for field in clone.fields)
+        clone.fields = tuple(
+            _bindField(field, object) for field in clone.fields)
+        clone._bound_fields = (object, clone.fields)
         return clone
 
 
+def getParsedQuery(index, query, request=None):
+    """Return the parse tree of a query validated during the request.
+
+    `QueryTextLineConstraint` remembers the parse tree of each query it
+    validates for the index it validated the query for, so that the search
+    can run the tree (``tree.executeQuery(index.index)``) instead of parsing
+    the query again.  Returns None if the query was not validated during the
+    request of the current interaction (or the given request).
+    """
+    parsed = getRequestCache(PARSED_QUERIES, request)
+    if parsed is not None:
+        return parsed.get((index, query))
+
+
+class _ParserEntry:
+    """The query parser of a lexicon and the queries it parsed."""
+
+    def __init__(self, lexicon, cache_size):
+        self.pipeline = getattr(lexicon, '_pipeline', None)
+        self.parser = zope.index.text.queryparser.QueryParser(lexicon)
+        self.queries = LRUCache(cache_size)
+        # The parser keeps its state while parsing, so it must not be used
+        # by two threads at the same time.
+        self.lock = threading.Lock()
+
+
 class QueryTextLineConstraint(BaseField, schema.TextLine):
-    def __init__(self, index_getter=None, catalog_name=None, index_name=None):
+    """Constraint checking that the value is a valid text index query.
+
+    The query parser of a lexicon is created once and the outcome of parsing
+    a query is remembered in a least recently used cache holding up to
+    `cache_size` queries for each lexicon.  The cache of a lexicon is
+    dropped when the lexicon gets another pipeline, as that changes how
+    queries are parsed.
+
+    >>> from zope.index.text.textindex import TextIndex
+    >>> index = TextIndex()
+    >>> constraint = QueryTextLineConstraint(lambda context: index)
+    >>> field = TextLine(__name__='query', constraints=(constraint,))
+    >>> field.validate(u'cow and dog')
+    >>> field.validate(u'cow and dog')
+    >>> field.validate(u'and') # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    MessageValidationError: (u'Invalid query.', None)
+    >>> field.validate(u'and') # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    MessageValidationError: (u'Invalid query.', None)
+    >>> sorted(constraint.getCacheStatistics().items())
+    [('evictions', 0), ('hits', 2), ('misses', 2), ('size', 2)]
+
+    Replacing the pipeline of the lexicon invalidates its cache:
+
+    >>> index.lexicon._pipeline = index.lexicon._pipeline[:1]
+    >>> field.validate(u'cow and dog')
+    >>> sorted(constraint.getCacheStatistics().items())
+    [('evictions', 0), ('hits', 2), ('misses', 3), ('size', 1)]
+
+    The caches can also be invalidated explicitly:
+
+    >>> constraint.invalidate()
+    >>> constraint.getCacheStatistics()['size']
+    0
+
+    Invalid queries raise a new `ParseError` each time, so the cache keeps
+    no traceback:
+
+    >>> from zope.index.text.parsetree import ParseError
+    >>> errors = []
+    >>> for i in range(2):
+    ...     try:
+    ...         constraint.parseQuery(index.lexicon, u'and')
+    ...     except ParseError as e:
+    ...         errors.append(e)
+    >>> errors[0] is errors[1], errors[0].args == errors[1].args
+    (False, True)
+
+    Fields using the constraint can be pickled and copied; the caches are
+    left out:
+
+    >>> import copy, pickle
+    >>> catalogued = TextLine(constraints=(QueryTextLineConstraint(
+    ...     catalog_name=u'catalog', index_name=u'text'),))
+    >>> clone = pickle.loads(pickle.dumps(catalogued))
+    >>> clone.constraints[0].index_name
+    'text'
+    >>> clone.constraints[0].getCacheStatistics()['size']
+    0
+    >>> copy.deepcopy(catalogued).constraints[0].catalog_name
+    'catalog'
+
+    During a request the parse tree of each valid query is kept for the
+    search which follows, see `getParsedQuery`:
+
+    >>> import zope.security.management
+    >>> from zope.publisher.browser import TestRequest
+    >>> zope.security.management.newInteraction(TestRequest())
+    >>> getParsedQuery(index, u'cow or dog') is None
+    True
+    >>> field.validate(u'cow or dog')
+    >>> tree = getParsedQuery(index, u'cow or dog')
+    >>> tree.nodeType()
+    'OR'
+    >>> tree.terms()
+    ['cow', 'dog']
+    >>> zope.security.management.endInteraction()
+    >>> getParsedQuery(index, u'cow or dog') is None
+    True
+
+    A cost budget keeps expensive queries away from the index.  The cost of
+    a query is estimated from the words it matches and their posting lists:
+
+    >>> index = TextIndex()
+    >>> for docid in range(10):
+    ...     index.index_doc(docid, u'cow cattle catnip dog %d' % docid)
+    >>> constraint = QueryTextLineConstraint(
+    ...     lambda context: index, max_cost=25)
+    >>> field = TextLine(__name__='query', constraints=(constraint,))
+    >>> lexicon = index.lexicon
+    >>> constraint.estimateCost(index, constraint.parseQuery(lexicon, u'cow'))
+    11
+    >>> constraint.estimateCost(index, constraint.parseQuery(lexicon, u'ca*'))
+    22
+    >>> constraint.estimateCost(
+    ...     index, constraint.parseQuery(lexicon, u'unknown'))
+    0
+    >>> field.validate(u'cow and not dog')
+    >>> field.validate(u'cow or dog or cat*') # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    MessageValidationError: (u'The query is too expensive.', None)
+    """
+
+    cache_size = 100
+    max_cost = None
+
+    def __init__(self, index_getter=None, catalog_name=None, index_name=None,
+                 cache_size=100, max_cost=None):
         assert not ((catalog_name is None) ^ (index_name is None))
         assert (index_getter is None) ^ (catalog_name is None)
         self.catalog_name = catalog_name
         self.index_name = index_name
         self.index_getter = index_getter
+        self.cache_size = cache_size
+        self.max_cost = max_cost
+        self._initCaches()
+
+    def _initCaches(self):
+        self._parsers = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = 0
+
+    # The caches are left out of pickles and copies.
+    _cache_attributes = ('_parsers', '_lock', '_hits', '_misses',
+                         '_evictions')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self._cache_attributes:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._initCaches()
 
     def __call__(self, field, value):
         if self.index_getter is not None:
@@ -446,11 +1894,114 @@ class QueryTextLineConstraint(BaseField, schema.TextLine):
                 self.catalog_name,
                 field.context)
             index = catalog[self.index_name]
-        parser = zope.index.text.queryparser.QueryParser(index.lexicon)
         try:
-            parser.parseQuery(value)
+            tree = self.parseQuery(index.lexicon, value)
         except zope.index.text.parsetree.ParseError:
             raise MessageValidationError(_bad_query)
+        if self.max_cost is not None:
+            try:
+                cost = self.estimateCost(index, tree, self.max_cost)
+            except zope.index.text.parsetree.QueryError:
+                raise MessageValidationError(_bad_query)
+            if cost > self.max_cost:
+                raise MessageValidationError(_expensive_query)
+        parsed = getRequestCache(PARSED_QUERIES)
+        if parsed is not None:
+            parsed[index, value] = tree
+
+    def _getParserEntry(self, lexicon):
+        with self._lock:
+            entry = self._parsers.get(lexicon)
+            if (entry is None
+                    or entry.pipeline is not getattr(
+                        lexicon, '_pipeline', None)):
+                if entry is not None:
+                    self._retire(entry)
+                entry = self._parsers[lexicon] = _ParserEntry(
+                    lexicon, self.cache_size)
+            return entry
+
+    def _retire(self, entry):
+        # keep the counters of dropped caches
+        self._hits += entry.queries.hits
+        self._misses += entry.queries.misses
+        self._evictions += entry.queries.evictions
+
+    def parseQuery(self, lexicon, query):
+        """Return the parse tree of the query for the lexicon.
+
+        Raises `zope.index.text.parsetree.ParseError` for an invalid query.
+        """
+        entry = self._getParserEntry(lexicon)
+        result = entry.queries.get(query, _marker)
+        if result is _marker:
+            with entry.lock:
+                try:
+                    result = entry.parser.parseQuery(query)
+                except zope.index.text.parsetree.ParseError as e:
+                    result = _CachedError(e)
+            entry.queries.set(query, result)
+        if isinstance(result, _CachedError):
+            raise result.create()
+        return result
+
+    def estimateCost(self, index, tree, limit=None):
+        """Estimate the cost of searching the index with the parse tree.
+
+        The cost of a word is one plus the length of its posting list in the
+        index; words not in the lexicon cost nothing.  A glob costs the words
+        it expands to, a phrase the words it contains; the cost of a query is
+        the sum of the costs of its words.  The estimation stops as soon as
+        the cost exceeds `limit`.
+        """
+        if tree is None:
+            return 0
+        lexicon = index.lexicon
+        wordinfo = getattr(getattr(index, 'index', None), '_wordinfo', None)
+        cost = 0
+        nodes = [tree]
+        while nodes:
+            node = nodes.pop()
+            node_type = node.nodeType()
+            if node_type in ('AND', 'OR'):
+                nodes.extend(node.getValue())
+                continue
+            elif node_type == 'NOT':
+                nodes.append(node.getValue())
+                continue
+            elif node_type == 'GLOB':
+                wids = lexicon.globToWordIds(node.getValue())
+            else:
+                wids = lexicon.termToWordIds(node.getValue())
+            for wid in wids:
+                if not wid:
+                    continue  # word not in the lexicon
+                cost += 1
+                if wordinfo is not None:
+                    cost += len(wordinfo.get(wid, ()))
+            if limit is not None and cost > limit:
+                break
+        return cost
+
+    def invalidate(self):
+        """Drop the parsers and the parsed queries of all lexicons."""
+        with self._lock:
+            for entry in self._parsers.values():
+                self._retire(entry)
+            self._parsers.clear()
+
+    def getCacheStatistics(self):
+        """Return the hits, misses and evictions of the query cache."""
+        with self._lock:
+            entries = list(self._parsers.values())
+            statistics = {'hits': self._hits, 'misses': self._misses,
+                          'evictions': self._evictions, 'size': 0}
+        for entry in entries:
+            statistics['hits'] += entry.queries.hits
+            statistics['misses'] += entry.queries.misses
+            statistics['evictions'] += entry.queries.evictions
+            statistics['size'] += len(entry.queries)
+        return statistics
 
 
 class TextLine(BaseField, schema.TextLine):
@@ -498,3 +2049,137 @@ class HTMLSnippet(BaseField, schema.Text):
 @interface.implementer(interfaces.IHTMLDocument)
 class HTMLDocument(BaseField, schema.Text):
     """Simple implementation for HTML document."""
+
+
+class UniqueTextLineConstraint(BaseField, schema.TextLine):
+    """Constraint checking that no other object has the value in an index.
+
+    The index, e.g. a field index of a catalog, is looked up like the one of
+    `QueryTextLineConstraint`.  The context of the field is excluded, so
+    editing an object keeps its value valid.
+
+    >>> import zope.index.field
+    >>> index = zope.index.field.FieldIndex()
+    >>> index.index_doc(1, u'A-1')
+    >>> index.index_doc(2, u'A-2')
+    >>> constraint = UniqueTextLineConstraint(lambda context: index)
+    >>> field = TextLine(__name__='external_id', constraints=(constraint,))
+    >>> field.validate(u'A-3')
+    >>> field.validate(u'A-1')
+    Traceback (most recent call last):
+    ...
+    MessageValidationError: (u'${value} is already used.', {'value': u'A-1'})
+
+    `validate_many` looks up the values of the whole batch at once, and
+    reports the values repeated in the batch:
+
+    >>> lookups = []
+    >>> def index_getter(context):
+    ...     lookups.append(context)
+    ...     return index
+    >>> constraint = UniqueTextLineConstraint(index_getter)
+    >>> field = TextLine(__name__='external_id', constraints=(constraint,),
+    ...                  required=False)
+    >>> for ix, error in field.validate_many(
+    ...         [u'A-3', u'A-1', u'A-4', u'A-3', None, u'A-2']):
+    ...     print(ix, error.args[1])
+    1 {'value': 'A-1'}
+    3 {'value': 'A-3'}
+    5 {'value': 'A-2'}
+    >>> len(lookups)
+    1
+
+    Fields using the constraint can be pickled and copied; the state of the
+    batch is left out:
+
+    >>> import copy, pickle
+    >>> catalogued = TextLine(constraints=(UniqueTextLineConstraint(
+    ...     catalog_name=u'catalog', index_name=u'external_id'),))
+    >>> clone = pickle.loads(pickle.dumps(catalogued))
+    >>> clone.constraints[0].index_name
+    'external_id'
+    >>> copy.deepcopy(catalogued).constraints[0].catalog_name
+    'catalog'
+    """
+
+    def __init__(self, index_getter=None, catalog_name=None,
+                 index_name=None):
+        assert not ((catalog_name is None) ^ (index_name is None))
+        assert (index_getter is None) ^ (catalog_name is None)
+        self.catalog_name = catalog_name
+        self.index_name = index_name
+        self.index_getter = index_getter
+        self._batch = threading.local()
+
+    # The state of the batch is left out of pickles and copies.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_batch', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._batch = threading.local()
+
+    def _getIndex(self, field):
+        if self.index_getter is not None:
+            return self.index_getter(field.context)
+        catalog = component.getUtility(
+            zope.catalog.interfaces.ICatalog,
+            self.catalog_name,
+            field.context)
+        return catalog[self.index_name]
+
+    def _getId(self, field):
+        """Return the id of the context of the field, or None."""
+        if field.context is None:
+            return None
+        intids = component.queryUtility(
+            zope.intid.interfaces.IIntIds, context=field.context)
+        if intids is None:
+            return None
+        return intids.queryId(field.context)
+
+    def _usedByOthers(self, index, value, own_id):
+        # Field indexes keep the documents of each value in a BTree.
+        forward = getattr(index, '_fwd_index', None)
+        if forward is not None:
+            docids = forward.get(value, ())
+        else:
+            docids = index.apply((value, value))
+        for docid in docids:
+            if docid != own_id:
+                return True
+        return False
+
+    def __call__(self, field, value):
+        batch = getattr(self._batch, 'state', None)
+        if batch is not None and batch[0] is field:
+            used, seen = batch[1], batch[2]
+            if value in used or value in seen:
+                raise MessageValidationError(_not_unique, {'value': value})
+            seen.add(value)
+            return
+        index = self._getIndex(field)
+        if self._usedByOthers(index, value, self._getId(field)):
+            raise MessageValidationError(_not_unique, {'value': value})
+
+    @contextlib.contextmanager
+    def prefetch(self, field, values):
+        """Look up the values of a batch validated by `validate_many`.
+
+        The index and the id of the context are looked up once, and each
+        distinct value once, in sorted order.  Values repeated in the batch
+        are used by the first one.
+        """
+        index = self._getIndex(field)
+        own_id = self._getId(field)
+        used = {value for value in sorted({v for v in values
+                                           if isinstance(v, str)})
+                if self._usedByOthers(index, value, own_id)}
+        previous = getattr(self._batch, 'state', None)
+        self._batch.state = (field, used, set())
+        try:
+            yield
+        finally:
+            self._batch.state = previous
@@ -0,0 +1,301 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Validate the records of CSV and JSON lines files while streaming them.
+
+The pipeline is made of generators, so only one batch of records is in
+memory at a time: a reader yields the raw records, `convertRecords`
+converts the raw values to the values of the fields of a schema and
+`validateRecords` validates them a batch at a time with `validate_many`,
+sending the errors to a sink and yielding the valid records.
+
+    >>> import io
+    >>> from zope import interface, schema
+    >>> from zc.form.field import Combination, Option, Union
+    >>> from zc.form.field import OrderedCombinationConstraint
+    >>> class IEvent(interface.Interface):
+    ...     title = schema.TextLine(title=u'Title')
+    ...     seats = Union((schema.Int(min=1), Option(value=u'unlimited')),
+    ...                   title=u'Seats')
+    ...     dates = Combination(
+    ...         (schema.Date(), schema.Date(required=False)),
+    ...         title=u'Dates', constraints=(OrderedCombinationConstraint(),))
+    >>> data = io.StringIO(
+    ...     'title,seats,dates.0,dates.1\\n'
+    ...     'Concert,0:120,2005-06-22,\\n'
+    ...     'Fair,1:unlimited,2005-06-22,2005-06-26\\n'
+    ...     ',0:12,2005-06-22,2005-06-20\\n'
+    ...     'Party,0:many,2005-06-22,\\n')
+    >>> errors = []
+    >>> records = validateRecords(
+    ...     convertRecords(readCSV(data), IEvent),
+    ...     IEvent, lambda *error: errors.append(error))
+    >>> for number, values in records:
+    ...     print(number, sorted(values.items()))
+    1 [('dates', (datetime.date(2005, 6, 22), None)), ('seats', 120), ('title', 'Concert')]
+    2 [('dates', (datetime.date(2005, 6, 22), datetime.date(2005, 6, 26))), ('seats', 'unlimited'), ('title', 'Fair')]
+    >>> for number, name, error in errors:
+    ...     print(number, name, error.__class__.__name__)
+    3 title RequiredMissing
+    3 dates MessageValidationError
+    4 seats ConversionError
+
+Combination values are the columns ``name.0``, ``name.1`` and so on of a
+CSV file, or lists in a JSON lines file.  Values of a `Union` are tagged
+with the index of the unioned field, ``index:value`` in a CSV file or
+``[index, value]`` in a JSON lines file as `zc.form.wire` encodes them.
+Other values are decoded as `zc.form.wire` decodes them too, like bytes
+from base64; only the CSV text of booleans and numbers is parsed here.
+
+    >>> data = io.StringIO(
+    ...     '{"title": "Concert", "seats": [0, 120],'
+    ...     ' "dates": ["2005-06-22", null]}\\n'
+    ...     '\\n'
+    ...     '{"title": "Fair", "seats": [2, 1], "dates": ["2005-06-22"]}\\n')
+    >>> statistics = ImportStatistics()
+    >>> records = validateRecords(
+    ...     convertRecords(readJSONLines(data), IEvent),
+    ...     IEvent, lambda *error: errors.append(error),
+    ...     statistics=statistics)
+    >>> [number for number, values in records]
+    [1]
+    >>> errors[-2:]
+    [(2, 'seats', ConversionError(...)), (2, 'dates', MessageValidationError(...))]
+    >>> statistics.records, statistics.invalid
+    (2, 1)
+    >>> statistics.rowsPerSecond() > 0
+    True
+"""  # noqa
+import csv
+import json
+import time
+
+from zope import schema
+from zope.schema.interfaces import ValidationError
+
+import zc.form.field
+import zc.form.wire
+from zc.form.field import Combination
+from zc.form.field import Union
+from zc.form.wire import ConversionError
+from zc.form.wire import splitTag
+
+
+def readCSV(stream, **kw):
+    """Yield a mapping of column names to values for each row."""
+    return csv.DictReader(stream, **kw)
+
+
+def readJSONLines(stream):
+    """Yield the JSON object of each line which is not blank."""
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _parseBool(value):
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return True
+    if value in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(value)
+
+
+# Parsers of the CSV text of the types JSON has values of, looked up in
+# order, so bool comes before its base class int.  The text of the other
+# types is decoded as `zc.form.wire` encodes it.
+_parsers = (
+    (bool, _parseBool),
+    (int, int),
+    (float, float),
+)
+
+
+def _leafConverter(field):
+    type_ = getattr(field, '_type', None)
+    parse = None
+    if isinstance(type_, type):
+        for cls, parser in _parsers:
+            if issubclass(type_, cls):
+                parse = parser
+                break
+    missing_value = field.missing_value
+
+    def convert(raw):
+        if raw is None or raw == '':
+            return missing_value
+        if parse is not None and isinstance(raw, str):
+            try:
+                return parse(raw)
+            except ValueError:
+                raise ConversionError(raw)
+        return zc.form.wire.decode(field, raw, validate=False)
+    return convert
+
+
+def _combinationConverter(field):
+    members = tuple(converter(f) for f in field.fields)
+    missing_value = field.missing_value
+
+    def convert(raw):
+        if raw is None or raw == '':
+            return missing_value
+        if isinstance(raw, (str, bytes)) or not hasattr(raw, '__iter__'):
+            raise ConversionError(raw)
+        raw = list(raw)
+        if len(raw) != len(members):
+            # let the validation report the wrong size
+            return tuple(raw)
+        return tuple(convert(r) for convert, r in zip(members, raw))
+    return convert
+
+
+def _unionConverter(field):
+    alternatives = tuple(converter(f) for f in field.fields)
+    missing_value = field.missing_value
+
+    def convert(raw):
+        if raw is None or raw == '':
+            return missing_value
+        if isinstance(raw, str):
+            index, sep, payload = raw.partition(':')
+            if not sep or not index.isdigit():
+                raise ConversionError(raw)
+            raw = int(index), payload
+        index, payload = splitTag(field, raw)
+        return alternatives[index](payload)
+    return convert
+
+
+_converters = {
+    Combination: _combinationConverter,
+    Union: _unionConverter,
+}
+
+
+def converter(field):
+    """Return a function converting a raw value to a value of the field.
+
+    The function raises a `ConversionError` if it cannot convert the value.
+    """
+    for cls in type(field).__mro__:
+        factory = _converters.get(cls)
+        if factory is not None:
+            return factory(field)
+    return _leafConverter(field)
+
+
+def _rawValue(record, name, field):
+    if name in record:
+        return record[name]
+    if isinstance(field, Combination):
+        prefix = name + '.'
+        raw = [record.get(prefix + str(ix)) for ix in range(len(field.fields))]
+        if any(r not in (None, '') for r in raw):
+            return raw
+    return None
+
+
+def convertRecords(records, iface):
+    """Yield ``(number, values, errors)`` for each raw record.
+
+    `values` maps the names of the fields of the schema to the converted
+    values, `errors` is the list of ``(name, error)`` pairs of the values
+    which could not be converted.  Records are numbered from 1.
+    """
+    converters = [(name, field, converter(field))
+                  for name, field in schema.getFieldsInOrder(iface)]
+    for number, record in enumerate(records, 1):
+        values = {}
+        errors = []
+        for name, field, convert in converters:
+            try:
+                values[name] = convert(_rawValue(record, name, field))
+            except ValidationError as error:
+                errors.append((name, error))
+        yield number, values, errors
+
+
+class ImportStatistics:
+    """Counts the records validated and measures the throughput."""
+
+    def __init__(self):
+        self.records = self.invalid = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def update(self, records, invalid):
+        self.records += records
+        self.invalid += invalid
+        self.elapsed = time.perf_counter() - self.started
+
+    def rowsPerSecond(self):
+        if not self.elapsed:
+            return 0.0
+        return self.records / self.elapsed
+
+
+def _validateBatch(batch, fields, sink):
+    invalid = {}
+    for ix, (number, values, errors) in enumerate(batch):
+        if errors:
+            invalid[ix] = errors
+    for name, field in fields:
+        column = []
+        rows = []
+        for ix, (number, values, errors) in enumerate(batch):
+            if name in values:
+                rows.append(ix)
+                column.append(values[name])
+        for ix, error in zc.form.field.validate_many(field, column):
+            invalid.setdefault(rows[ix], []).append((name, error))
+    for ix, (number, values, errors) in enumerate(batch):
+        errors = invalid.get(ix)
+        if errors is None:
+            yield number, values
+        else:
+            for name, error in errors:
+                sink(number, name, error)
+
+
+def validateRecords(converted, iface, sink, batch_size=1000,
+                    statistics=None, report=None):
+    """Validate the converted records a batch at a time.
+
+    Yield ``(number, values)`` for each valid record, in order, and call
+    ``sink(number, name, error)`` for each error of the others, conversion
+    errors included.  The `statistics` are updated and passed to `report`
+    after each batch.
+    """
+    fields = schema.getFieldsInOrder(iface)
+    if statistics is None:
+        statistics = ImportStatistics()
+    batch = []
+    for record in converted:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield from _finishBatch(batch, fields, sink, statistics, report)
+            batch = []
+    if batch:
+        yield from _finishBatch(batch, fields, sink, statistics, report)
+
+
+def _finishBatch(batch, fields, sink, statistics, report):
+    valid = 0
+    for record in _validateBatch(batch, fields, sink):
+        valid += 1
+        yield record
+    statistics.update(len(batch), len(batch) - valid)
+    if report is not None:
+        report(statistics)
@@ -0,0 +1,530 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Catalog indexes for values of zc.form fields.
+
+`IntervalIndex` indexes ranges, like the values of a
+``Combination((Date, Date), constraints=(OrderedCombinationConstraint(),))``
+field, as a relational interval tree: each interval is stored at the node
+of a virtual binary tree over the integers (its fork) which is the first
+node on the path from the root lying inside the interval.  Two BTrees keyed
+by ``(fork, lower bound)`` and ``(fork, upper bound)`` hold the intervals,
+so a query visits the nodes on the paths to its bounds, one BTree range
+lookup each, and the forks inside the queried range with a single range
+lookup.
+
+    >>> import datetime
+    >>> index = IntervalIndex()
+    >>> index.index_doc(1, (datetime.date(2005, 6, 22),
+    ...                     datetime.date(2005, 7, 10)))
+    >>> index.index_doc(2, (datetime.date(2005, 7, 1), None))
+    >>> index.index_doc(3, (None, datetime.date(2005, 6, 1)))
+    >>> index.index_doc(4, (datetime.date(2005, 7, 10),
+    ...                     datetime.date(2005, 7, 10)))
+    >>> index.documentCount()
+    4
+
+`stab` returns the documents whose interval contains a point, the bounds
+included; a missing bound is open:
+
+    >>> list(index.stab(datetime.date(2005, 7, 10)))
+    [1, 2, 4]
+    >>> list(index.stab(datetime.date(2005, 6, 1)))
+    [3]
+    >>> list(index.stab(datetime.date(2005, 6, 10)))
+    []
+
+`overlapping` returns the documents whose interval overlaps a range:
+
+    >>> list(index.overlapping(datetime.date(2005, 6, 1),
+    ...                        datetime.date(2005, 6, 22)))
+    [1, 3]
+    >>> list(index.overlapping(datetime.date(2005, 7, 11), None))
+    [2]
+
+`apply` takes either query:
+
+    >>> list(index.apply({'at': datetime.date(2005, 7, 2)}))
+    [1, 2]
+    >>> list(index.apply({'overlapping': (None, datetime.date(2005, 6, 22))}))
+    [1, 3]
+
+Documents are indexed and unindexed incrementally:
+
+    >>> index.index_doc(4, (datetime.date(2005, 5, 1),
+    ...                     datetime.date(2005, 5, 31)))
+    >>> list(index.stab(datetime.date(2005, 7, 10)))
+    [1, 2]
+    >>> index.unindex_doc(1)
+    >>> list(index.stab(datetime.date(2005, 7, 10)))
+    [2]
+    >>> index.index_doc(2, None)
+    >>> list(index.stab(datetime.date(2005, 7, 10)))
+    []
+    >>> index.documentCount()
+    2
+
+Values which are not ranges of indexable bounds are not indexed; an
+indexed document is unindexed:
+
+    >>> index.index_doc(3, (datetime.date(2005, 7, 10),
+    ...                     datetime.date(2005, 7, 1)))
+    >>> index.index_doc(5, (1.5, 2.5))
+    >>> index.index_doc(6, (u'a', u'b'))
+    >>> index.index_doc(7, u'2005')
+    >>> list(index.stab(datetime.date(2005, 5, 10)))
+    [4]
+    >>> index.documentCount()
+    1
+
+Bounds are integers, dates or datetimes, converted to microseconds so
+dates and datetimes can be mixed; timezone aware datetimes are converted
+to UTC.  `CatalogIntervalIndex` indexes an attribute in a catalog.
+
+`UnionIndex` keeps the values of a `Union` field partitioned by the unioned
+field which accepts them, so searching for the values of one alternative
+does not validate the values again.  `CatalogUnionIndex` finds the
+alternative with `validFieldIndex` when indexing an attribute:
+
+    >>> from zope import interface, schema
+    >>> from zc.form.field import Union
+    >>> class IIssue(interface.Interface):
+    ...     category = Union(
+    ...         (schema.Choice(values=(u'bug', u'feature')),
+    ...          schema.TextLine(title=u'Other')),
+    ...         title=u'Category')
+    >>> @interface.implementer(IIssue)
+    ... class Issue:
+    ...     def __init__(self, category):
+    ...         self.category = category
+    >>> index = CatalogUnionIndex('category', IIssue)
+    >>> for docid, category in enumerate(
+    ...         [u'bug', u'typo', u'feature', u'bug', u'question'], 1):
+    ...     index.index_doc(docid, Issue(category))
+    >>> list(index.apply({'alternative': 1}))
+    [2, 5]
+    >>> list(index.apply({'alternative': 0, 'value': u'bug'}))
+    [1, 4]
+    >>> list(index.apply({'alternative': 1, 'value': u'bug'}))
+    []
+    >>> list(index.apply({'alternative': 1, 'between': (u'q', None)}))
+    [2, 5]
+    >>> sorted(index.values(1))
+    ['question', 'typo']
+
+    >>> index.index_doc(2, Issue(u'feature'))
+    >>> list(index.apply({'alternative': 0, 'value': u'feature'}))
+    [2, 3]
+    >>> index.index_doc(5, Issue(None))
+    >>> list(index.apply({'alternative': 1}))
+    []
+    >>> index.documentCount()
+    4
+"""  # noqa
+import datetime
+
+import BTrees
+import persistent
+import zope.catalog.attribute
+import zope.catalog.interfaces
+import zope.container.contained
+import zope.index.interfaces
+import zope.interface
+from BTrees.Length import Length
+
+from zc.form import interfaces
+
+
+_MARKER = object()
+
+# The root of the virtual tree is 0, its leaves are the integers in
+# [_MIN, _MAX].
+_ROOT = 2 ** 62
+_MIN = -_ROOT + 1
+_MAX = _ROOT - 1
+_DAY = 86400 * 10 ** 6
+_EPOCH = datetime.datetime(1, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def toInteger(value):
+    """Return the integer a bound is indexed as.
+
+    >>> toInteger(datetime.date(1, 1, 2))
+    172800000000
+    >>> toInteger(datetime.datetime(1, 1, 2, 0, 0, 1))
+    172801000000
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(
+                tzinfo=None)
+        return (value - _EPOCH) // _MICROSECOND + _DAY
+    if isinstance(value, datetime.date):
+        return value.toordinal() * _DAY
+    if isinstance(value, int) and _MIN <= value <= _MAX:
+        return value
+    raise ValueError('Cannot index bound', value)
+
+
+def _bounds(lower, upper):
+    lower = _MIN if lower is None else toInteger(lower)
+    upper = _MAX if upper is None else toInteger(upper)
+    return lower, upper
+
+
+def _fork(lower, upper):
+    """Return the node of the virtual tree the interval is stored at."""
+    node = 0
+    step = _ROOT // 2
+    while not lower <= node <= upper:
+        if upper < node:
+            node -= step
+        else:
+            node += step
+        step //= 2
+    return node
+
+
+def _path(point):
+    """Yield the nodes on the path from the root to the point."""
+    node = 0
+    step = _ROOT // 2
+    while True:
+        yield node
+        if node == point or not step:
+            return
+        if point < node:
+            node -= step
+        else:
+            node += step
+        step //= 2
+
+
+@zope.interface.implementer(
+    zope.index.interfaces.IInjection,
+    zope.index.interfaces.IStatistics,
+    zope.index.interfaces.IIndexSearch,
+)
+class IntervalIndex(persistent.Persistent):
+    """An index of intervals answering stabbing and overlap queries.
+
+    The value of a document is a ``(lower, upper)`` pair of bounds; None as
+    a bound is open.  Missing values (None), reversed ranges and bounds
+    which cannot be indexed unindex the document, like the other indexes
+    do with values they do not accept.
+    """
+
+    family = BTrees.family32
+
+    def __init__(self, family=None):
+        if family is not None:
+            self.family = family
+        self.clear()
+
+    def clear(self):
+        """Initialize the intervals and the reverse mapping."""
+        # Map (fork, bound) to the set of docids
+        self._lower = BTrees.OOBTree.OOBTree()
+        self._upper = BTrees.OOBTree.OOBTree()
+        # Map docids to their (fork, lower, upper)
+        self._rev_index = self.family.IO.BTree()
+        self._num_docs = Length(0)
+
+    def documentCount(self):
+        """See interface IStatistics"""
+        return self._num_docs()
+
+    def wordCount(self):
+        """See interface IStatistics"""
+        return len(self._lower)
+
+    def _insert(self, tree, key, docid):
+        docids = tree.get(key)
+        if docids is None:
+            docids = tree[key] = self.family.IF.TreeSet()
+        docids.insert(docid)
+
+    def _remove(self, tree, key, docid):
+        docids = tree.get(key)
+        if docids is not None:
+            docids.remove(docid)
+            if not docids:
+                del tree[key]
+
+    def index_doc(self, docid, value):
+        """See interface IInjection"""
+        try:
+            lower, upper = _bounds(*value)
+        except (TypeError, ValueError):
+            # None, not a pair or bounds which cannot be indexed
+            lower, upper = _MAX, _MIN
+        if lower > upper:
+            self.unindex_doc(docid)
+            return
+        entry = _fork(lower, upper), lower, upper
+        old = self._rev_index.get(docid)
+        if old == entry:
+            return
+        if old is not None:
+            self.unindex_doc(docid)
+        fork = entry[0]
+        self._insert(self._lower, (fork, lower), docid)
+        self._insert(self._upper, (fork, upper), docid)
+        self._rev_index[docid] = entry
+        self._num_docs.change(1)
+
+    def unindex_doc(self, docid):
+        """See interface IInjection"""
+        entry = self._rev_index.get(docid, _MARKER)
+        if entry is _MARKER:
+            return  # not in index
+        del self._rev_index[docid]
+        fork, lower, upper = entry
+        self._remove(self._lower, (fork, lower), docid)
+        self._remove(self._upper, (fork, upper), docid)
+        self._num_docs.change(-1)
+
+    def overlapping(self, lower, upper):
+        """Return the docids of the intervals overlapping the range."""
+        lower, upper = _bounds(lower, upper)
+        if lower > upper:
+            return self.family.IF.Set()
+        sets = []
+        nodes = set(_path(lower))
+        nodes.update(_path(upper))
+        for node in nodes:
+            if node < lower:
+                # intervals left of the range unless they reach into it
+                sets.extend(self._upper.values(
+                    (node, lower), (node, _MAX)))
+            elif node > upper:
+                sets.extend(self._lower.values(
+                    (node, _MIN), (node, upper)))
+        # intervals whose fork is in the range overlap it
+        sets.extend(self._lower.values((lower, _MIN), (upper, _MAX)))
+        return self.family.IF.multiunion(sets)
+
+    def stab(self, point):
+        """Return the docids of the intervals containing the point."""
+        return self.overlapping(point, point)
+
+    def apply(self, query):
+        """Search with ``{'at': point}`` or ``{'overlapping': (low, high)}``.
+        """
+        if len(query) == 1:
+            if 'at' in query:
+                return self.stab(query['at'])
+            if 'overlapping' in query:
+                return self.overlapping(*query['overlapping'])
+        raise TypeError("'at' or 'overlapping' query expected", query)
+
+
+class ICatalogIntervalIndex(zope.catalog.interfaces.IAttributeIndex,
+                            zope.catalog.interfaces.ICatalogIndex):
+    """Interface-based catalog interval index
+    """
+
+
+@zope.interface.implementer(ICatalogIntervalIndex)
+class CatalogIntervalIndex(zope.catalog.attribute.AttributeIndex,
+                           IntervalIndex,
+                           zope.container.contained.Contained):
+    """An `IntervalIndex` of an attribute for a catalog."""
+
+
+def _key(value):
+    """Return the BTree key a value of an alternative is indexed under.
+
+    Missing members of combinations sort first, so the keys of a
+    combination with optional members are ordered:
+
+    >>> _key((None, 2)) < _key((1, 2))
+    True
+    >>> _value(_key((None, (1, None))))
+    (None, (1, None))
+    """
+    if isinstance(value, tuple):
+        return tuple((item is not None, _key(item)) for item in value)
+    return value
+
+
+def _value(key):
+    """Return the value indexed under a key."""
+    if isinstance(key, tuple):
+        return tuple(_value(item) for present, item in key)
+    return key
+
+
+@zope.interface.implementer(
+    zope.index.interfaces.IInjection,
+    zope.index.interfaces.IStatistics,
+    zope.index.interfaces.IIndexSearch,
+)
+class UnionIndex(persistent.Persistent):
+    """An index of values partitioned by the alternative they belong to.
+
+    The value of a document is an ``(alternative, value)`` pair, the
+    alternative being the index of the unioned field accepting the value.
+    Values which cannot be ordered with the other values of their
+    alternative are not indexed.
+    """
+
+    family = BTrees.family32
+
+    def __init__(self, family=None):
+        if family is not None:
+            self.family = family
+        self.clear()
+
+    def clear(self):
+        """Initialize the partitions and the reverse mapping."""
+        # Map alternatives to a mapping of values to docids
+        self._values = BTrees.IOBTree.IOBTree()
+        # Map alternatives to all their docids
+        self._docids = BTrees.IOBTree.IOBTree()
+        # Map docids to their (alternative, value)
+        self._rev_index = self.family.IO.BTree()
+        self._num_docs = Length(0)
+
+    def documentCount(self):
+        """See interface IStatistics"""
+        return self._num_docs()
+
+    def wordCount(self):
+        """See interface IStatistics"""
+        return sum(len(values) for values in self._values.values())
+
+    def index_doc(self, docid, value):
+        """See interface IInjection"""
+        if value is None:
+            self.unindex_doc(docid)
+            return
+        alternative, value = value
+        key = _key(value)
+        old = self._rev_index.get(docid)
+        if old is not None:
+            if old == (alternative, key):
+                return
+            self.unindex_doc(docid)
+        values = self._values.get(alternative)
+        if values is None:
+            values = BTrees.OOBTree.OOBTree()
+        try:
+            docids = values.get(key)
+            if docids is None:
+                docids = values[key] = self.family.IF.TreeSet()
+        except TypeError:
+            return  # not comparable with the other keys
+        if alternative not in self._values:
+            self._values[alternative] = values
+            self._docids[alternative] = self.family.IF.TreeSet()
+        docids.insert(docid)
+        self._docids[alternative].insert(docid)
+        self._rev_index[docid] = alternative, key
+        self._num_docs.change(1)
+
+    def unindex_doc(self, docid):
+        """See interface IInjection"""
+        entry = self._rev_index.get(docid, _MARKER)
+        if entry is _MARKER:
+            return  # not in index
+        del self._rev_index[docid]
+        alternative, key = entry
+        values = self._values[alternative]
+        docids = values[key]
+        docids.remove(docid)
+        if not docids:
+            del values[key]
+        docids = self._docids[alternative]
+        docids.remove(docid)
+        if not docids:
+            del self._values[alternative]
+            del self._docids[alternative]
+        self._num_docs.change(-1)
+
+    def values(self, alternative):
+        """Return the values indexed for the alternative."""
+        values = self._values.get(alternative)
+        if values is None:
+            return ()
+        return map(_value, values.keys())
+
+    def apply(self, query):
+        """Search the documents of an alternative.
+
+        The query maps 'alternative' to the index of the unioned field and
+        may restrict the value with 'value' or with 'between', a pair of
+        inclusive bounds (None is open).
+        """
+        try:
+            alternative = query['alternative']
+        except (KeyError, TypeError):
+            raise TypeError("'alternative' query expected", query)
+        empty = self.family.IF.Set()
+        if 'value' in query:
+            values = self._values.get(alternative)
+            if values is None:
+                return empty
+            try:
+                docids = values.get(_key(query['value']), ())
+            except TypeError:
+                return empty
+            return self.family.IF.Set(docids)
+        if 'between' in query:
+            values = self._values.get(alternative)
+            if values is None:
+                return empty
+            lower, upper = (None if bound is None else _key(bound)
+                            for bound in query['between'])
+            return self.family.IF.multiunion(values.values(lower, upper))
+        return self.family.IF.Set(self._docids.get(alternative, ()))
+
+
+class ICatalogUnionIndex(zope.catalog.interfaces.IAttributeIndex,
+                         zope.catalog.interfaces.ICatalogIndex):
+    """Interface-based catalog index of a union field
+    """
+
+
+@zope.interface.implementer(ICatalogUnionIndex)
+class CatalogUnionIndex(zope.catalog.attribute.AttributeIndex,
+                        UnionIndex,
+                        zope.container.contained.Contained):
+    """A `UnionIndex` of an attribute defined by a `Union` field.
+
+    The interface is required: the field the attribute is defined by finds
+    the alternative of the values.  Values no unioned field accepts are not
+    indexed.
+    """
+
+    def __init__(self, field_name=None, interface=None, *args, **kw):
+        super().__init__(field_name, interface, *args, **kw)
+        if self.interface is None or not interfaces.IUnionField.providedBy(
+                self.interface.get(self.field_name)):
+            raise ValueError('The interface must define a union field',
+                             self.field_name)
+
+    def index_doc(self, docid, object):
+        """See interface IInjection"""
+        object = self.interface(object, None)
+        if object is None:
+            return None
+        value = getattr(object, self.field_name, None)
+        if value is None:
+            return self.unindex_doc(docid)
+        field = self.interface[self.field_name].bind(object)
+        alternative = field.validFieldIndex(value)
+        if alternative is None:
+            return self.unindex_doc(docid)
+        return UnionIndex.index_doc(self, docid, (alternative, value))
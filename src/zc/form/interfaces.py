@@ -37,10 +37,59 @@ class IExtendedField(zope.schema.interfaces.IField):
     def default_getter(context):
         """Return the default value."""
 
+    constraint_statistics = interface.Attribute(
+        """None, or the statistics recorded about the constraints if the
+        field orders them adaptively""")
+
+    def getConstraintStatistics():
+        """Return the cost and failure rate recorded for each constraint.
+
+        Returns None unless the field orders its constraints adaptively.
+        """
+
+    def getConstraintCacheStatistics():
+        """Return the hits, misses and evictions of the cache of the outcomes
+        of pure constraints.
+
+        Returns None if the field has no pure constraints.
+        """
+
+    def validate_async(value, executor=None):
+        """Validate the value, awaiting I/O-bound constraints concurrently.
+
+        This is a coroutine.  Constraints which are coroutine functions or
+        marked as blocking run concurrently, the blocking ones in the
+        executor.  Raise the error `validate` would raise.
+        """
+
+    def check(value):
+        """Return a verdict about the value without raising an exception.
+
+        The verdict is true if `validate` accepts the value.  Otherwise its
+        `error` attribute is the exception `validate` would raise.
+        """
+
+    def validate_many(values):
+        """Validate a sequence of values.
+
+        Return a list of ``(index, error)`` pairs, one for each value which
+        does not validate, ordered by index.
+        """
+
     default = interface.Attribute(
         """if default_getter has been set, returns the result of that call;
         otherwise returns whatever value has been set as the default.""")
 
+    cache_default = schema.Bool(
+        description=_("""Whether the result of default_getter is computed
+        only once for each context during a request"""))
+
+    def invalidateDefault(context=None):
+        """Forget the default computed for the context during the request.
+
+        Forget the defaults computed for all contexts if context is None.
+        """
+
 
 class IOptionField(IExtendedField):
     """Field with excatly one predefined value
@@ -60,9 +109,19 @@ class IOptionField(IExtendedField):
         description=_("""Whether validation comparison should be identity
         (as opposed to equality) based"""))
 
+    cache_value = schema.Bool(
+        description=_("""Whether the result of value_getter is computed only
+        once for each context during a request"""))
+
     def getValue():
         """Return value for option field."""
 
+    def invalidateValue(context=None):
+        """Forget the value computed for the context during the request.
+
+        Forget the values computed for all contexts if context is None.
+        """
+
 
 class IUnionField(IExtendedField):
     """A field that may have one of many field types of values.
@@ -90,6 +149,10 @@ class IUnionField(IExtendedField):
     def validField(value):
         """Return first valid field for the given value, or None"""
 
+    def validFieldIndex(value):
+        """Return the index of the first valid field for the given value, or
+        None"""
+
 
 class ICombinationField(IExtendedField):
     """A field that describes a combination of two or more fields"""
@@ -0,0 +1,207 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Validate stored values again after a field changed.
+
+`revalidate` validates a stream of ``(oid, value)`` records with the field
+returned by a factory and yields the records which do not validate.  With
+more than one process the records are split into chunks validated by a
+pool of worker processes.  Each worker calls the factory once, so the
+factory has to be picklable (e.g. a module level function), while the
+field itself, its constraints and getters need not be.
+
+    >>> import datetime
+    >>> from zope import schema
+    >>> from zc.form.field import Combination, OrderedCombinationConstraint
+    >>> def factory():
+    ...     return Combination(
+    ...         (schema.Date(title=u'Begin', required=False),
+    ...          schema.Date(title=u'Expire', required=True)),
+    ...         __name__='publication_range',
+    ...         constraints=(OrderedCombinationConstraint(),))
+    >>> records = [
+    ...     (1, (datetime.date(2005, 6, 22), datetime.date(2005, 7, 10))),
+    ...     (2, (datetime.date(2005, 6, 22), None)),
+    ...     (3, (None, datetime.date(2005, 7, 10)))]
+    >>> progress = []
+    >>> for oid, error in revalidate(records, factory, processes=0,
+    ...                              chunksize=2,
+    ...                              progress=lambda *a: progress.append(a)):
+    ...     print(oid, repr(error))
+    2 RequiredMissing('combination_01')
+    >>> progress
+    [(2, 1), (3, 1)]
+
+Errors are sent back without the field they were raised for:
+
+    >>> error.field is None
+    True
+
+The factory may return a schema instead of a field.  The value of each
+record is then a mapping of field names to values, and the errors are lists
+of ``(name, error)`` pairs:
+
+    >>> from zope import interface
+    >>> class IRange(interface.Interface):
+    ...     publication_range = factory()
+    ...     title = schema.TextLine(title=u'Title')
+    >>> records = [(1, {'publication_range': records[0][1]})]
+    >>> list(revalidate(records, lambda: IRange, processes=0))
+    [(1, [('title', RequiredMissing('title'))])]
+
+`objectRecords` reads the records from the objects of a database, e.g. one
+opened on a `FileStorage` with `openFileStorage`.
+"""
+import itertools
+import multiprocessing
+import pickle
+
+from zope import schema
+from zope.interface.interfaces import IInterface
+from zope.schema.interfaces import ValidationError
+
+
+# The validator of the worker process, set by `_initWorker`.
+_validator = None
+
+
+class _SchemaErrors(Exception):
+    """The errors of the fields of a schema."""
+
+
+def _schemaValidator(iface):
+    fields = schema.getFieldsInOrder(iface)
+
+    def validate(values):
+        errors = []
+        for name, field in fields:
+            try:
+                field.validate(values.get(name, field.missing_value))
+            except ValidationError as error:
+                errors.append((name, error))
+        if errors:
+            raise _SchemaErrors(errors)
+    return validate
+
+
+def _makeValidator(field_factory):
+    field = field_factory()
+    if IInterface.providedBy(field):
+        return _schemaValidator(field)
+    return field.validate
+
+
+def _portable(error):
+    """Return the error without the field, so it can be pickled."""
+    error.field = None
+    try:
+        pickle.dumps(error)
+    except Exception:
+        return ValidationError(repr(error))
+    return error
+
+
+def _validateChunk(chunk, validate=None):
+    """Return the number of records and the failures of the chunk."""
+    if validate is None:
+        validate = _validator
+    failures = []
+    for oid, value in chunk:
+        try:
+            validate(value)
+        except ValidationError as error:
+            failures.append((oid, _portable(error)))
+        except _SchemaErrors as errors:
+            failures.append((oid, [(name, _portable(error))
+                                   for name, error in errors.args[0]]))
+    return len(chunk), failures
+
+
+def _initWorker(field_factory):
+    global _validator
+    _validator = _makeValidator(field_factory)
+
+
+def _chunks(records, chunksize):
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def revalidate(records, field_factory, processes=None, chunksize=100,
+               progress=None):
+    """Yield ``(oid, error)`` for each record which does not validate.
+
+    `records` is an iterable of ``(oid, value)`` pairs, `field_factory` a
+    callable returning the field (or schema) to validate the values with.
+    `processes` is the size of the process pool, the number of CPUs if
+    None; with 0 or 1 the records are validated in this process.  The
+    failures are yielded in the order of the records.  `progress` is called
+    with the number of records validated and of failures after each chunk.
+    """
+    chunks = _chunks(records, chunksize)
+    if processes is not None and processes <= 1:
+        validate = _makeValidator(field_factory)
+        results = (_validateChunk(chunk, validate) for chunk in chunks)
+        yield from _report(results, progress)
+        return
+    with multiprocessing.Pool(processes, _initWorker,
+                              (field_factory,)) as pool:
+        yield from _report(pool.imap(_validateChunk, chunks), progress)
+
+
+def _report(results, progress):
+    done = failed = 0
+    for count, failures in results:
+        done += count
+        failed += len(failures)
+        yield from failures
+        if progress is not None:
+            progress(done, failed)
+
+
+def objectRecords(db, getValue, select=None, cache_size=1000):
+    """Yield ``(oid, value)`` for the objects stored in the database.
+
+    `getValue` returns the value to validate for an object.  Only the
+    objects for which `select` returns true are used if it is given.  The
+    cache of the connection is minimized every `cache_size` objects.
+    """
+    connection = db.open()
+    try:
+        storage = db.storage
+        next_oid = None
+        count = 0
+        while True:
+            oid, tid, data, next_oid = storage.record_iternext(next_oid)
+            obj = connection.get(oid)
+            if select is None or select(obj):
+                yield oid, getValue(obj)
+            count += 1
+            if not count % cache_size:
+                connection.cacheMinimize()
+            if next_oid is None:
+                break
+    finally:
+        connection.close()
+
+
+def openFileStorage(path, read_only=True):
+    """Open a database on the `FileStorage` at the path."""
+    import ZODB
+    import ZODB.FileStorage
+    storage = ZODB.FileStorage.FileStorage(path, read_only=read_only)
+    return ZODB.DB(storage)
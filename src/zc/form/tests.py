@@ -12,15 +12,622 @@
 #
 ##############################################################################
 """tests"""
+import datetime
+import decimal
 import doctest
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import persistent
+import transaction
+import ZODB
+import ZODB.FileStorage
+import zope.component.hooks
+import zope.component.testing
+import zope.index.field
+import zope.intid.interfaces
+from zope import component
+from zope import interface
+from zope import schema
+
+import zc.form.compiler
+import zc.form.field
+import zc.form.importer
+import zc.form.index
+import zc.form.revalidate
+import zc.form.wire
+from zc.form.field import Combination
+from zc.form.field import HTMLDocument
+from zc.form.field import HTMLSnippet
+from zc.form.field import Option
+from zc.form.field import OrderedCombinationConstraint
+from zc.form.field import TextLine
+from zc.form.field import Union
+
+
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestOrderedCombinationConstraintVectorized(unittest.TestCase):
+    """Testing OrderedCombinationConstraint.violations() and .errors()."""
+
+    def field(self, field_factory, size, **kw):
+        return Combination(
+            [field_factory(required=False) for i in range(size)],
+            constraints=(OrderedCombinationConstraint(**kw),))
+
+    def assertSameErrors(self, field, rows, columns):
+        constraint = field.constraints[0]
+        expected = []
+        for ix, row in enumerate(rows):
+            try:
+                constraint(field, row)
+            except schema.ValidationError as e:
+                expected.append((ix, e.args))
+        errors = [(ix, e.args) for ix, e in constraint.errors(field, columns)]
+        self.assertEqual(errors, expected)
+        self.assertEqual(
+            numpy.flatnonzero(constraint.violations(field, columns)).tolist(),
+            [ix for ix, args in expected])
+
+    def test_matches_per_value_constraint(self):
+        """It flags the rows the constraint rejects, with the same errors."""
+        rnd = random.Random(42)
+        for kw in ({}, {'may_be_equal': False}, {'decreasing': True},
+                   {'decreasing': True, 'may_be_equal': False}):
+            field = self.field(schema.Int, 3, **kw)
+            rows = [tuple(rnd.choice([None, 1, 2, 3]) for i in range(3))
+                    for j in range(500)]
+            columns = [numpy.array([row[i] for row in rows], dtype=object)
+                       for i in range(3)]
+            self.assertSameErrors(field, rows, columns)
+
+    def test_datetime64_columns(self):
+        """NaT entries of datetime64 columns are missing values."""
+        field = self.field(schema.Date, 2)
+        begin = numpy.array(
+            ['2005-06-22', 'NaT', '2005-06-22', '2005-07-10'],
+            dtype='datetime64[D]')
+        expire = numpy.array(
+            ['2005-07-10', '2005-07-10', '1995-07-10', 'NaT'],
+            dtype='datetime64[D]')
+        rows = [(datetime.date(2005, 6, 22), datetime.date(2005, 7, 10)),
+                (None, datetime.date(2005, 7, 10)),
+                (datetime.date(2005, 6, 22), datetime.date(1995, 7, 10)),
+                (datetime.date(2005, 7, 10), None)]
+        self.assertSameErrors(field, rows, [begin, expire])
+
+    def test_datetime64_ns_columns(self):
+        """Nanosecond columns give the errors of dates and datetimes."""
+        begin = numpy.array(
+            ['2005-06-22', 'NaT', '2005-07-10'], dtype='datetime64[ns]')
+        expire = numpy.array(
+            ['2005-07-10', '2005-07-10', '2005-06-22'],
+            dtype='datetime64[ns]')
+        dates = [(datetime.date(2005, 6, 22), datetime.date(2005, 7, 10)),
+                 (None, datetime.date(2005, 7, 10)),
+                 (datetime.date(2005, 7, 10), datetime.date(2005, 6, 22))]
+        self.assertSameErrors(
+            self.field(schema.Date, 2), dates, [begin, expire])
+        datetimes = [
+            tuple(None if d is None else datetime.datetime(d.year, d.month,
+                                                           d.day)
+                  for d in row)
+            for row in dates]
+        self.assertSameErrors(
+            self.field(schema.Datetime, 2), datetimes, [begin, expire])
+
+    def test_float_columns(self):
+        """NaN entries of float columns are missing values."""
+        field = self.field(schema.Float, 3, may_be_equal=False)
+        columns = [numpy.array([1.0, 2.0, numpy.nan]),
+                   numpy.array([numpy.nan, 1.0, 2.0]),
+                   numpy.array([1.0, 3.0, 2.0])]
+        rows = [(1.0, None, 1.0), (2.0, 1.0, 3.0), (None, 2.0, 2.0)]
+        self.assertSameErrors(field, rows, columns)
+
+    def test_wrong_number_of_columns(self):
+        """It needs one column per field."""
+        field = self.field(schema.Int, 3)
+        with self.assertRaises(ValueError):
+            field.constraints[0].violations(field, [[1], [2]])
+
+
+optionflags = (
+    doctest.NORMALIZE_WHITESPACE
+    | doctest.IGNORE_EXCEPTION_DETAIL
+    | doctest.REPORT_ONLY_FIRST_FAILURE
+    | doctest.ELLIPSIS
+    | doctest.REPORT_NDIFF
+)
+
+
+def not_context(field, value):
+    if value == field.context.forbidden:
+        raise schema.ValidationError('forbidden')
+
+
+class INested(interface.Interface):
+
+    span = Combination(
+        (Union((schema.Int(min=0),
+                Option(value='open'),
+                Combination((schema.Int(), schema.Int(required=False)),
+                            constraints=(OrderedCombinationConstraint(),)))),
+         schema.Int(required=False),
+         TextLine(required=False, max_length=3,
+                  constraints=(not_context,))),
+        constraints=(OrderedCombinationConstraint(),),
+        required=False)
+
+    choice = Union(
+        (schema.Choice(values=('a', 'b')),
+         Option(value_getter=lambda context: context.forbidden),
+         schema.Date()))
+
+
+class Nested:
+
+    def __init__(self, span, choice, forbidden='no'):
+        self.span = span
+        self.choice = choice
+        self.forbidden = forbidden
+
+
+class TestCompiler(unittest.TestCase):
+    """Testing zc.form.compiler against the normal validation."""
+
+    def test_same_errors_as_normal_validation(self):
+        """The compiled validator reports the errors of the normal path."""
+        rnd = random.Random(42)
+        members = [None, -1, 0, 1, 2, 'open', (1, 2), (2, 1), (1, None),
+                   (1,), 'ab', 'no', 'abcd', 1.5]
+        choices = [None, 'a', 'c', 'no', datetime.date(2005, 6, 22), 1]
+        validator = zc.form.compiler.compileSchema(INested)
+        for i in range(2000):
+            span = rnd.choice([
+                None, 17, (1, 2),
+                tuple(rnd.choice(members) for j in range(3))])
+            obj = Nested(span, rnd.choice(choices))
+            try:
+                expected = schema.getSchemaValidationErrors(INested, obj)
+            except TypeError:
+                # OrderedCombinationConstraint cannot compare the members
+                self.assertRaises(TypeError, validator, obj)
+                continue
+            self.assertEqual(
+                [(name, type(error), error.args) for name, error in
+                 sorted(validator(obj), key=lambda error: error[0])],
+                [(name, type(error), error.args) for name, error in
+                 sorted(expected, key=lambda error: error[0])])
+
+
+class CountingInt(schema.Int):
+
+    validated = 0
+
+    def _validate(self, value):
+        CountingInt.validated += 1
+        super()._validate(value)
+
+
+class NotMemoizing(dict):
+
+    def __setitem__(self, key, value):
+        pass
+
+
+class TestNestedValidationMemo(unittest.TestCase):
+    """Worst case benchmark for nested Union and Combination fields."""
+
+    levels = 4
+
+    def setUp(self):
+        CountingInt.validated = 0
+        # Each level is a union of three combinations sharing the field of
+        # the level below; only the last combination accepts the value, so
+        # each level probes the shared field three times.
+        field = CountingInt()
+        value = 42
+        for level in range(self.levels):
+            field = Union([
+                Combination((field, Option(value=tag)))
+                for tag in ('a', 'b', 'c')])
+            value = (value, 'c')
+        self.field = field
+        self.value = value
+
+    def test_validate_is_linear(self):
+        """Each sub-value gets validated once for each field."""
+        self.field.validate(self.value)
+        self.assertEqual(CountingInt.validated, 1)
+        self.assertTrue(self.field.check(self.value))
+        self.assertEqual(CountingInt.validated, 2)
+
+    def test_without_memo_it_is_exponential(self):
+        """Without the memo the innermost field is validated 3**4 times."""
+        scope = zc.form.field._scope
+        scope.verdicts = NotMemoizing()
+        try:
+            self.field.validate(self.value)
+        finally:
+            scope.verdicts = None
+        self.assertEqual(CountingInt.validated, 3 ** self.levels)
+
+    def test_errors_are_the_same(self):
+        """The memo does not change the reported errors."""
+        value = (((('no', 'c'), 'c'), 'c'), 'c')
+        with self.assertRaises(schema.ValidationError) as memoized:
+            self.field.validate(value)
+        scope = zc.form.field._scope
+        scope.verdicts = NotMemoizing()
+        try:
+            with self.assertRaises(schema.ValidationError) as plain:
+                self.field.validate(value)
+        finally:
+            scope.verdicts = None
+        self.assertEqual(memoized.exception, plain.exception)
+
+
+class TestFlatValidationOverhead(unittest.TestCase):
+    """Fields without nested Union or Combination members memoize nothing."""
+
+    def setUp(self):
+        self.calls = 0
+        self.valueKey = zc.form.field._valueKey
+
+        def counting(value):
+            self.calls += 1
+            return self.valueKey(value)
+        zc.form.field._valueKey = counting
+
+    def tearDown(self):
+        zc.form.field._valueKey = self.valueKey
+
+    def test_combination(self):
+        """A flat Combination does not look up verdicts."""
+        field = Combination(
+            (schema.Date(), schema.Date()),
+            constraints=(OrderedCombinationConstraint(),)).bind(object())
+        value = (datetime.date(2005, 6, 22), datetime.date(2005, 7, 1))
+        field.validate(value)
+        self.assertTrue(field.check(value))
+        self.assertEqual(self.calls, 0)
+
+    def test_union(self):
+        """A flat Union does not look up verdicts."""
+        field = Union((schema.Choice(values=('a', 'b')), schema.Int(),
+                       schema.TextLine()))
+        field.validate('x')
+        self.assertTrue(field.check('x'))
+        self.assertEqual(self.calls, 0)
+
+    def test_nested(self):
+        """Nesting fields turns the memo on."""
+        field = Union((Combination((schema.Int(), schema.Int())),
+                       schema.TextLine()))
+        field.validate((1, 2))
+        self.assertGreater(self.calls, 0)
+
+
+class Publication(persistent.Persistent):
+
+    def __init__(self, publication_range):
+        self.publication_range = publication_range
+
+
+def publication_range_field():
+    return Combination(
+        (schema.Date(required=False), schema.Date(required=True)),
+        constraints=(OrderedCombinationConstraint(may_be_equal=False),))
+
+
+class TestRevalidate(unittest.TestCase):
+    """Testing zc.form.revalidate with a FileStorage and a process pool."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'Data.fs')
+        db = ZODB.DB(ZODB.FileStorage.FileStorage(self.path))
+        connection = db.open()
+        root = connection.root()
+        day = datetime.date(2005, 6, 22)
+        ranges = [(day, day + datetime.timedelta(i % 3)) for i in range(20)]
+        root['publications'] = [Publication(r) for r in ranges]
+        transaction.commit()
+        # With may_be_equal=False, every third range is invalid.
+        self.expected = [p._p_oid for i, p in enumerate(
+            root['publications']) if not i % 3]
+        connection.close()
+        db.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_revalidate_stored_objects(self):
+        db = zc.form.revalidate.openFileStorage(self.path)
+        progress = []
+        try:
+            records = zc.form.revalidate.objectRecords(
+                db, lambda obj: obj.publication_range,
+                select=lambda obj: isinstance(obj, Publication))
+            failures = list(zc.form.revalidate.revalidate(
+                records, publication_range_field, processes=2, chunksize=3,
+                progress=lambda *args: progress.append(args)))
+        finally:
+            db.close()
+        self.assertEqual([oid for oid, error in failures], self.expected)
+        self.assertEqual(
+            {type(error) for oid, error in failures},
+            {zc.form.field.MessageValidationError})
+        self.assertEqual(progress[-1], (20, 7))
+        self.assertEqual(len(progress), 7)
+
+
+class IRow(interface.Interface):
+
+    number = schema.Int(min=0)
+    span = Combination((schema.Int(), schema.Int()),
+                       constraints=(OrderedCombinationConstraint(),))
+
+
+class TestImporter(unittest.TestCase):
+    """Testing zc.form.importer with an endless source."""
+
+    def test_streams_in_batches(self):
+        def rows():
+            for i in itertools.count():
+                yield {'number': str(i % 7 - 1),
+                       'span.0': str(i), 'span.1': str(i + 1)}
+        reports = []
+        errors = []
+        records = zc.form.importer.validateRecords(
+            zc.form.importer.convertRecords(rows(), IRow), IRow,
+            lambda *error: errors.append(error), batch_size=50,
+            report=lambda statistics: reports.append(statistics.records))
+        valid = list(itertools.islice(records, 120))
+        # the source is endless, so only the batches needed were read
+        self.assertEqual(reports, [50, 100])
+        self.assertEqual(valid[0], (2, {'number': 0, 'span': (1, 2)}))
+        self.assertEqual(len(errors), 20)
+        self.assertEqual({name for number, name, error in errors},
+                         {'number'})
+
+    def test_decodes_as_wire(self):
+        date = datetime.date(2005, 6, 22)
+
+        class IPayload(interface.Interface):
+            data = schema.Bytes()
+            price = schema.Decimal()
+            due = Option(value=date)
+            day = schema.Choice(values=(date, datetime.date(2005, 6, 23)))
+            flag = schema.Bool()
+        values = {'data': b'\x00\xff', 'price': decimal.Decimal('1.50'),
+                  'due': date, 'day': date, 'flag': True}
+        encoded = {name: zc.form.wire.encode(IPayload[name], value)
+                   for name, value in values.items()}
+        records = [encoded, dict(encoded, flag='true')]
+        converted = list(
+            zc.form.importer.convertRecords(records, IPayload))
+        self.assertEqual(converted, [(1, values, []), (2, values, [])])
+
+
+class TestWireRoundTrip(unittest.TestCase):
+    """Decoding the encoding of a value returns the value."""
+
+    date = datetime.date(2005, 6, 22)
+    amount = decimal.Decimal('1.5')
+
+    def assertRoundTrip(self, field, *values):
+        for value in values:
+            data = zc.form.wire.encode(field, value)
+            self.assertEqual(zc.form.wire.decode(field, data), value)
+
+    def test_text_fields(self):
+        """TextLine, HTMLSnippet and HTMLDocument values are text."""
+        self.assertRoundTrip(TextLine(), u'line')
+        self.assertRoundTrip(HTMLSnippet(), u'<b>snippet</b>')
+        self.assertRoundTrip(HTMLDocument(), u'<html></html>')
+
+    def test_option(self):
+        """Option values are decoded as the type of the option's value."""
+        self.assertRoundTrip(Option(value=self.date), self.date)
+        self.assertRoundTrip(Option(value=self.amount), self.amount)
+        self.assertRoundTrip(Option(value=b'\x00\xff'), b'\x00\xff')
+        self.assertRoundTrip(Option(value=u'never'), u'never')
+
+    def test_choice(self):
+        """Choice values are decoded through the terms of the vocabulary."""
+        self.assertRoundTrip(
+            schema.Choice(values=(self.date, datetime.date(2005, 7, 1))),
+            self.date)
+        self.assertRoundTrip(
+            schema.Choice(values=(self.amount,)), self.amount)
+
+    def test_union(self):
+        """Each alternative decodes its own values."""
+        field = Union((Option(value=self.amount),
+                       schema.Choice(values=(self.date,)),
+                       schema.Int(),
+                       schema.Bytes(),
+                       schema.Datetime()))
+        self.assertRoundTrip(
+            field, self.amount, self.date, 3, b'\x00',
+            datetime.datetime(2005, 6, 22, 12, 30))
+
+    def test_combination(self):
+        """Combinations nest, with missing members."""
+        field = Combination(
+            (Option(value=self.amount),
+             schema.Choice(values=(self.date,)),
+             Combination((schema.Date(required=False),
+                          Union((schema.Choice(values=(self.date,)),
+                                 Option(value=u'never')))))))
+        self.assertRoundTrip(
+            field,
+            (self.amount, self.date, (None, self.date)),
+            (self.amount, self.date, (self.date, u'never')))
+
+
+class Span:
+
+    def __init__(self, span):
+        self.span = span
+
+
+class TestIntervalIndex(unittest.TestCase):
+    """Testing zc.form.index.IntervalIndex against a full scan."""
+
+    def test_same_results_as_scanning(self):
+        rnd = random.Random(42)
+        index = zc.form.index.CatalogIntervalIndex('span')
+        spans = {}
+
+        def bound():
+            return rnd.choice([None, rnd.randint(-1000, 1000)])
+        for i in range(3000):
+            docid = rnd.randint(1, 300)
+            if rnd.random() < 0.1:
+                index.unindex_doc(docid)
+                spans.pop(docid, None)
+                continue
+            lower, upper = bound(), bound()
+            if None not in (lower, upper) and lower > upper:
+                lower, upper = upper, lower
+            index.index_doc(docid, Span((lower, upper)))
+            spans[docid] = (lower, upper)
+
+        def overlaps(span, low, high):
+            lower, upper = span
+            return ((lower is None or high is None or lower <= high)
+                    and (upper is None or low is None or upper >= low))
+        self.assertEqual(index.documentCount(), len(spans))
+        for i in range(500):
+            low, high = bound(), bound()
+            if None not in (low, high) and low > high:
+                low, high = high, low
+            self.assertEqual(
+                list(index.overlapping(low, high)),
+                sorted(docid for docid, span in spans.items()
+                       if overlaps(span, low, high)))
+            if low is not None:
+                self.assertEqual(
+                    list(index.apply({'at': low})),
+                    sorted(docid for docid, span in spans.items()
+                           if overlaps(span, low, low)))
+
+
+class IBooking(interface.Interface):
+    period = Union(
+        (Combination((schema.Date(required=False), schema.Date())),
+         Combination((Union((schema.Int(), schema.TextLine())),
+                      schema.Int()))))
+
+
+@interface.implementer(IBooking)
+class Booking:
+
+    def __init__(self, period):
+        self.period = period
+
+
+class TestUnionIndex(unittest.TestCase):
+    """Testing zc.form.index.UnionIndex with Combination alternatives."""
+
+    def setUp(self):
+        self.index = zc.form.index.CatalogUnionIndex('period', IBooking)
+        self.date = datetime.date(2005, 7, 10)
+
+    def test_optional_member(self):
+        index = self.index
+        index.index_doc(1, Booking((self.date, self.date)))
+        index.index_doc(2, Booking((None, self.date)))
+        index.index_doc(3, Booking((self.date, self.date)))
+        self.assertEqual(index.documentCount(), 3)
+        self.assertEqual(list(index.values(0)),
+                         [(None, self.date), (self.date, self.date)])
+        self.assertEqual(
+            list(index.apply({'alternative': 0, 'value': (None, self.date)})),
+            [2])
+        self.assertEqual(
+            list(index.apply({'alternative': 0,
+                              'between': ((self.date, None), None)})),
+            [1, 3])
+        index.unindex_doc(2)
+        self.assertEqual(list(index.values(0)), [(self.date, self.date)])
+
+    def test_values_which_cannot_be_ordered(self):
+        index = self.index
+        index.index_doc(1, Booking((1, 2)))
+        index.index_doc(2, Booking((u'one', 2)))
+        index.index_doc(3, Booking((u'one', 2)))
+        self.assertEqual(index.documentCount(), 1)
+        self.assertEqual(list(index.apply({'alternative': 1})), [1])
+        index.index_doc(1, Booking((u'one', 2)))
+        index.index_doc(2, Booking((u'one', 2)))
+        self.assertEqual(index.documentCount(), 2)
+        self.assertEqual(list(index.values(1)), [(u'one', 2)])
+
+
+@interface.implementer(zope.intid.interfaces.IIntIds)
+class IntIds:
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def queryId(self, ob, default=None):
+        return self.ids.get(id(ob), default)
+
+
+class Account:
+    pass
+
+
+class TestUniqueTextLineConstraint(unittest.TestCase):
+    """Testing that UniqueTextLineConstraint excludes the context."""
+
+    def setUp(self):
+        zope.component.testing.setUp()
+        zope.component.hooks.setHooks()
+        self.index = zope.index.field.FieldIndex()
+        self.account = Account()
+        self.index.index_doc(1, 'A-1')
+        self.index.index_doc(2, 'A-2')
+        component.provideUtility(IntIds({id(self.account): 1}))
+        constraint = zc.form.field.UniqueTextLineConstraint(
+            lambda context: self.index)
+        self.field = TextLine(constraints=(constraint,)).bind(self.account)
+
+    def tearDown(self):
+        zope.component.hooks.resetHooks()
+        zope.component.testing.tearDown()
+
+    def test_own_value_is_unique(self):
+        self.field.validate('A-1')
+        self.assertRaises(schema.ValidationError, self.field.validate, 'A-2')
+
+    def test_batch_excludes_context(self):
+        errors = self.field.validate_many(['A-1', 'A-2', 'A-3'])
+        self.assertEqual([ix for ix, error in errors], [1])
 
 
 def test_suite():
-    return doctest.DocTestSuite(
-        "zc.form.field",
-        optionflags=(doctest.NORMALIZE_WHITESPACE
-                     | doctest.IGNORE_EXCEPTION_DETAIL
-                     | doctest.REPORT_ONLY_FIRST_FAILURE
-                     | doctest.ELLIPSIS
-                     | doctest.REPORT_NDIFF),
-    )
+    return unittest.TestSuite([
+        unittest.defaultTestLoader.loadTestsFromName(__name__),
+        doctest.DocTestSuite("zc.form.cache", optionflags=optionflags),
+        doctest.DocTestSuite("zc.form.compiler", optionflags=optionflags),
+        doctest.DocTestSuite("zc.form.field", optionflags=optionflags),
+        doctest.DocTestSuite("zc.form.importer", optionflags=optionflags),
+        doctest.DocTestSuite("zc.form.index", optionflags=optionflags),
+        doctest.DocTestSuite("zc.form.revalidate", optionflags=optionflags),
+        doctest.DocTestSuite("zc.form.tzsearch", optionflags=optionflags),
+        doctest.DocTestSuite("zc.form.wire", optionflags=optionflags),
+    ])
@@ -0,0 +1,355 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Search time zones by a substring of their names.
+
+`ZoneNameIndex` maps the n-grams of the normalized names (lower case,
+spaces as underscores) to the names containing them, so a search intersects
+a few posting lists instead of testing every name.  The results are sorted
+by name.
+
+    >>> index = ZoneNameIndex(['Europe/Berlin', 'America/New_York',
+    ...                        'America/Argentina/Buenos_Aires', 'UTC'])
+    >>> index.search(u'new york')
+    ['America/New_York']
+    >>> index.search(u'AmeR')
+    ['America/Argentina/Buenos_Aires', 'America/New_York']
+    >>> index.search(u'r')
+    ['America/Argentina/Buenos_Aires', 'America/New_York', 'Europe/Berlin']
+    >>> index.search(u'ber')
+    ['Europe/Berlin']
+    >>> index.search(u'erica/b')
+    []
+    >>> index.search(u'')
+    ['America/Argentina/Buenos_Aires', 'America/New_York', 'Europe/Berlin', 'UTC']
+
+The index of all the time zones of pytz is built once per process:
+
+    >>> getZoneNameIndex() is getZoneNameIndex()
+    True
+    >>> names = getZoneNameIndex().search(u'new_')
+    >>> 'America/New_York' in names
+    True
+    >>> names == sorted(name for name in pytz.all_timezones
+    ...                 if u'new_' in name.lower())
+    True
+
+`TimeZones` is a sequence of time zones created when they are accessed:
+
+    >>> zones = TimeZones(['Europe/Berlin', 'UTC'])
+    >>> len(zones), bool(zones)
+    (2, True)
+    >>> zones[0]
+    <DstTzInfo 'Europe/Berlin' LMT+0:53:00 STD>
+    >>> [zone.zone for zone in zones]
+    ['Europe/Berlin', 'UTC']
+    >>> bool(TimeZones([]))
+    False
+
+`TimeZoneSearch` also finds time zones by abbreviation, UTC offset and city
+alias, and ranks the results: exact matches first, then prefixes, then
+substrings, each sorted by name.  Names match exactly on the full name or
+its last component, and by prefix on the full name or any component.
+Aliases match exactly or by prefix:
+
+    >>> import datetime
+    >>> search = TimeZoneSearch(
+    ...     ['America/New_York', 'America/Indiana/Indianapolis',
+    ...      'Asia/Kolkata', 'Asia/Calcutta', 'Europe/Berlin', 'EST'],
+    ...     aliases={'Bombay': 'Asia/Kolkata', 'Munich': 'Europe/Berlin',
+    ...              'Nowhere': 'Mars/Olympus'},
+    ...     today=datetime.date(2024, 3, 1))
+    >>> search.search(u'EST')
+    ['America/Indiana/Indianapolis', 'America/New_York', 'EST']
+    >>> search.search(u'UTC+5:30')
+    ['Asia/Calcutta', 'Asia/Kolkata']
+    >>> search.search(u'gmt -04')
+    ['America/Indiana/Indianapolis', 'America/New_York']
+    >>> search.search(u'bombay')
+    ['Asia/Kolkata']
+    >>> search.search(u'Indiana')
+    ['America/Indiana/Indianapolis']
+    >>> search.search(u'ind')
+    ['America/Indiana/Indianapolis']
+    >>> search.search(u'a/n')
+    ['America/New_York']
+    >>> search.search(u'mun')
+    ['Europe/Berlin']
+    >>> search.search(u'cal')
+    ['Asia/Calcutta']
+    >>> search.search(u'k')
+    ['Asia/Kolkata', 'America/New_York']
+
+The search of all the time zones is built once per process:
+
+    >>> getTimeZoneSearch() is getTimeZoneSearch()
+    True
+    >>> getTimeZoneSearch().search(u'Bombay')
+    ['Asia/Kolkata']
+"""  # noqa
+import collections.abc
+import datetime
+import re
+import threading
+
+import pytz
+
+import zc.form.interfaces
+
+
+N = 3
+
+
+def normalize(text):
+    """Return the text as it is searched for in zone names."""
+    return text.strip().lower().replace(' ', '_')
+
+
+def _grams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class ZoneNameIndex:
+    """An index of zone names by their n-grams of up to `N` characters."""
+
+    def __init__(self, names):
+        self.names = tuple(sorted(names))
+        self._normalized = tuple(normalize(name) for name in self.names)
+        postings = {}
+        for ix, name in enumerate(self._normalized):
+            for n in range(1, N + 1):
+                for gram in _grams(name, n):
+                    postings.setdefault(gram, []).append(ix)
+        # The lists are sorted, as the names are visited in order.
+        self._postings = {gram: tuple(ixs) for gram, ixs in postings.items()}
+
+    def _candidates(self, text):
+        if len(text) <= N:
+            return self._postings.get(text, ())
+        postings = sorted(
+            (self._postings.get(gram, ()) for gram in _grams(text, N)),
+            key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        # The n-grams may occur in another order, so check the candidates.
+        normalized = self._normalized
+        return sorted(ix for ix in candidates if text in normalized[ix])
+
+    def search(self, text):
+        """Return the names containing the text, sorted."""
+        text = normalize(text)
+        if not text:
+            return list(self.names)
+        names = self.names
+        return [names[ix] for ix in self._candidates(text)]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def getZoneNameIndex():
+    """Return the index of the names of all the time zones."""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = ZoneNameIndex(pytz.all_timezones)
+    return _index
+
+
+class TimeZones(collections.abc.Sequence):
+    """The time zones of names, created when they are accessed."""
+
+    def __init__(self, names):
+        self.names = names
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, ix):
+        if isinstance(ix, slice):
+            return TimeZones(self.names[ix])
+        return pytz.timezone(self.names[ix])
+
+
+# Names of cities people search for which are not the names of time zones.
+CITY_ALIASES = {
+    'Atlanta': 'America/New_York',
+    'Bangalore': 'Asia/Kolkata',
+    'Barcelona': 'Europe/Madrid',
+    'Beijing': 'Asia/Shanghai',
+    'Bombay': 'Asia/Kolkata',
+    'Boston': 'America/New_York',
+    'Dallas': 'America/Chicago',
+    'Delhi': 'Asia/Kolkata',
+    'Frankfurt': 'Europe/Berlin',
+    'Geneva': 'Europe/Zurich',
+    'Hamburg': 'Europe/Berlin',
+    'Houston': 'America/Chicago',
+    'Madras': 'Asia/Kolkata',
+    'Miami': 'America/New_York',
+    'Milan': 'Europe/Rome',
+    'Montreal': 'America/Toronto',
+    'Mumbai': 'Asia/Kolkata',
+    'Munich': 'Europe/Berlin',
+    'Osaka': 'Asia/Tokyo',
+    'Peking': 'Asia/Shanghai',
+    'Philadelphia': 'America/New_York',
+    'Rio de Janeiro': 'America/Sao_Paulo',
+    'San Francisco': 'America/Los_Angeles',
+    'Seattle': 'America/Los_Angeles',
+    'Washington': 'America/New_York',
+}
+
+_offset = re.compile(
+    r'^(?:utc|gmt)?([+-])(\d{1,2})(?:[:.]?(\d{2}))?$')
+
+
+def parseOffset(text):
+    """Return the UTC offset in minutes the text stands for, or None.
+
+    >>> parseOffset(u'UTC+5:30'), parseOffset(u'-0800'), parseOffset(u'GMT')
+    (330, -480, None)
+    """
+    match = _offset.match(text.replace(' ', '').lower())
+    if match is None:
+        return None
+    sign, hours, minutes = match.groups()
+    offset = int(hours) * 60 + int(minutes or 0)
+    return -offset if sign == '-' else offset
+
+
+def _prefixes(text):
+    return {text[:i] for i in range(1, len(text) + 1)}
+
+
+def _add(mapping, keys, name):
+    for key in keys:
+        mapping.setdefault(key, set()).add(name)
+
+
+def _sorted(mapping):
+    return {key: tuple(sorted(names)) for key, names in mapping.items()}
+
+
+class TimeZoneSearch:
+    """Ranked search of time zones by name, abbreviation, offset and alias.
+
+    The texts matching each name exactly or as a prefix (of the name or of
+    one of its components) are computed in advance, so a search looks them
+    up.  Abbreviations and offsets are the ones in effect in January and
+    July of the year of `today`, covering standard and daylight saving time.
+    """
+
+    def __init__(self, names, aliases=CITY_ALIASES, today=None):
+        self.index = ZoneNameIndex(names)
+        names = self.index.names
+        if today is None:
+            today = datetime.date.today()
+        exact = {}
+        prefix = {}
+        for name, normalized in zip(names, self.index._normalized):
+            parts = normalized.split('/')
+            _add(exact, (normalized, parts[-1]), name)
+            keys = _prefixes(normalized)
+            for part in parts:
+                keys.update(_prefixes(part))
+            _add(prefix, keys, name)
+            zone = pytz.timezone(name)
+            for month in (1, 7):
+                moment = zone.localize(datetime.datetime(today.year, month, 1))
+                abbreviation = moment.tzname()
+                if abbreviation.isalpha():
+                    _add(exact, (abbreviation.lower(),), name)
+                offset = moment.utcoffset() // datetime.timedelta(minutes=1)
+                _add(exact, (offset,), name)
+        known = set(names)
+        for alias, name in aliases.items():
+            if name in known:
+                alias = normalize(alias)
+                _add(exact, (alias,), name)
+                _add(prefix, _prefixes(alias), name)
+        self._exact = _sorted(exact)
+        self._prefix = _sorted(prefix)
+
+    def search(self, text):
+        """Return the names of the matching time zones, best first."""
+        text = normalize(text)
+        if not text:
+            return list(self.index.names)
+        exact = set(self._exact.get(text, ()))
+        offset = parseOffset(text.replace('_', ''))
+        if offset is not None:
+            exact.update(self._exact.get(offset, ()))
+        result = sorted(exact)
+        seen = exact
+        for name in self._prefix.get(text, ()):
+            if name not in seen:
+                result.append(name)
+        seen = set(result)
+        index = self.index
+        for ix in index._candidates(text):
+            name = index.names[ix]
+            if name not in seen:
+                result.append(name)
+        return result
+
+
+_search = None
+
+
+def getTimeZoneSearch():
+    """Return the ranked search of all the time zones."""
+    global _search
+    if _search is None:
+        with _lock:
+            if _search is None:
+                _search = TimeZoneSearch(pytz.all_timezones)
+    return _search
+
+
+# The terms of the time zones of each territory, computed when first used.
+_territory_terms = {}
+
+
+def getTerritoryTerms(territory):
+    """Return the terms of the time zones of a territory, sorted by token.
+
+    The tuple is computed once per territory and shared, so it must not be
+    changed.
+
+    >>> terms = getTerritoryTerms('NZ')
+    >>> [(term.title, term.token) for term in terms]
+    [('Pacific/Auckland', 'Pacific/Auckland'), ('Pacific/Chatham', 'Pacific/Chatham')]
+    >>> getTerritoryTerms('nz') is terms
+    True
+    >>> [term.title for term in getTerritoryTerms('AR')][:2]
+    ['America/Argentina/Buenos Aires', 'America/Argentina/Catamarca']
+    >>> getTerritoryTerms('XX')
+    ()
+    """  # noqa
+    territory = territory.upper()
+    terms = _territory_terms.get(territory)
+    if terms is None:
+        try:
+            names = pytz.country_timezones(territory)
+        except KeyError:
+            names = ()
+        terms = tuple(zc.form.interfaces.Term(name.replace('_', ' '), name)
+                      for name in sorted(names))
+        terms = _territory_terms.setdefault(territory, terms)
+    return terms
@@ -0,0 +1,314 @@
+##############################################################################
+#
+# Copyright (c) 2026 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Encode values of zc.form fields as JSON compatible data.
+
+A `Union` value is encoded as the pair ``[index, payload]`` of the index of
+the unioned field accepting it (the ``NN`` of its ``unioned_NN`` name) and
+the encoding of the value for that field.  Decoding a union value validates
+it against the tagged field only instead of probing the unioned fields.
+`Combination` values are encoded as lists of the encoded members, so they
+nest.  Missing values are encoded as None.
+
+    >>> import datetime
+    >>> from zope import schema
+    >>> from zc.form.field import Combination, Option, Union
+    >>> from zc.form.field import OrderedCombinationConstraint
+    >>> expire = Union(
+    ...     (Option(value=u'never'),
+    ...      schema.Date(),
+    ...      Combination((schema.Int(min=1), schema.Choice(
+    ...          values=(u'days', u'weeks'))))),
+    ...     __name__='expire')
+    >>> field = Combination(
+    ...     (schema.Date(required=False), expire), __name__='publication')
+    >>> encode(field, (datetime.date(2005, 6, 22), datetime.date(2005, 7, 1)))
+    ['2005-06-22', [1, '2005-07-01']]
+    >>> encode(field, (None, (3, u'weeks')))
+    [None, [2, [3, 'weeks']]]
+    >>> encode(field, (None, u'never'))
+    [None, [0, 'never']]
+
+`decode` returns the value and validates it:
+
+    >>> decode(field, [None, [2, [3, 'weeks']]])
+    (None, (3, 'weeks'))
+    >>> decode(field, ['2005-06-22', [1, '2005-07-01']])
+    (datetime.date(2005, 6, 22), datetime.date(2005, 7, 1))
+    >>> decode(field, [None, [2, [0, 'weeks']]])
+    Traceback (most recent call last):
+    ...
+    TooSmall: (0, 1)
+    >>> decode(field, [None, [3, 'never']])
+    Traceback (most recent call last):
+    ...
+    ConversionError: (u'Cannot convert ${value}.', {'value': [3, 'never']})
+    >>> decode(field, [None, None])
+    Traceback (most recent call last):
+    ...
+    RequiredMissing: expire
+
+The constraints of the fields still apply:
+
+    >>> ranged = Combination(
+    ...     (schema.Date(), schema.Date()), __name__='range',
+    ...     constraints=(OrderedCombinationConstraint(),))
+    >>> decode(ranged, ['2005-07-01', '2005-06-22'])
+    ...     # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    MessageValidationError: (u'${minimum} must be less than or equal to ...
+    >>> decode(ranged, ['2005-07-01', '2005-06-22'], validate=False)
+    (datetime.date(2005, 7, 1), datetime.date(2005, 6, 22))
+
+A union accepts the values `validate` accepts, as `Union` does not apply
+constraints of its own:
+
+    >>> def never(field, value):
+    ...     raise schema.ValidationError('Never.')
+    >>> union = Union((schema.Int(), schema.TextLine()), __name__='union',
+    ...               constraints=(never,))
+    >>> union.validate(1)
+    >>> decode(union, [0, 1])
+    1
+"""  # noqa
+import base64
+import collections.abc
+import datetime
+import decimal
+
+from zope import schema
+from zope.schema.interfaces import ConstraintNotSatisfied
+from zope.schema.interfaces import RequiredMissing
+from zope.schema.interfaces import ValidationError
+
+from zc.form.field import Combination
+from zc.form.field import MessageValidationError
+from zc.form.field import Option
+from zc.form.field import Union
+from zc.form.i18n import _
+
+
+_conversion_error = _("Cannot convert ${value}.")
+
+
+class ConversionError(MessageValidationError):
+    """Data cannot be converted to a value of the field."""
+
+    def __init__(self, value):
+        super().__init__(_conversion_error, {'value': value})
+
+
+def splitTag(field, data):
+    """Return the index of the unioned field and the payload of the data.
+    """
+    try:
+        index, payload = data
+    except (TypeError, ValueError):
+        raise ConversionError(data)
+    if type(index) is not int or not 0 <= index < len(field.fields):
+        raise ConversionError(data)
+    return index, payload
+
+
+def _validateOwn(field, value):
+    """Validate the value with the checks of the field itself.
+
+    The contained fields have validated their members already.
+    """
+    if value == field.missing_value:
+        if field.required:
+            raise RequiredMissing(field.__name__).with_field_and_value(
+                field, value)
+        return
+    if isinstance(field, Union):
+        # `Union.validate` only checks the unioned fields.
+        return
+    if not field.constraint(value):
+        raise ConstraintNotSatisfied(
+            value, field.__name__).with_field_and_value(field, value)
+    field._runConstraints(value)
+
+
+# Types whose values are encoded as text, looked up in order, so datetime
+# comes before its base class date.
+_text_types = (
+    (datetime.datetime, datetime.datetime.isoformat,
+     datetime.datetime.fromisoformat),
+    (datetime.date, datetime.date.isoformat, datetime.date.fromisoformat),
+    (datetime.time, datetime.time.isoformat, datetime.time.fromisoformat),
+    (decimal.Decimal, str, decimal.Decimal),
+    (bytes, lambda value: base64.b64encode(value).decode('ascii'),
+     base64.b64decode),
+)
+
+
+def _textType(value_type):
+    if isinstance(value_type, type):
+        for entry in _text_types:
+            if issubclass(value_type, entry[0]):
+                return entry
+    return None
+
+
+def _encodeLeaf(field, value):
+    entry = _textType(type(value))
+    if entry is None:
+        return value
+    return entry[1](value)
+
+
+def decodeText(value_type, data):
+    """Return the value of the type the data encodes.
+
+    Values of the types encoded as text are parsed, other data is returned
+    as is.
+    """
+    entry = _textType(value_type)
+    if entry is None or not isinstance(data, str):
+        return data
+    try:
+        return entry[2](data)
+    except (ValueError, ArithmeticError):
+        raise ConversionError(data)
+
+
+def _decodeLeaf(field, data, validate):
+    if data is None:
+        value = field.missing_value
+    else:
+        value = decodeText(getattr(field, '_type', None), data)
+    if validate:
+        field.validate(value)
+    return value
+
+
+def _decodeOption(field, data, validate):
+    # The type of the value of the option tells how it was encoded.
+    if data is None:
+        value = field.missing_value
+    else:
+        value = decodeText(type(field.getValue()), data)
+    if validate:
+        field.validate(value)
+    return value
+
+
+def _choiceValue(field, data):
+    try:
+        vocabulary = field._resolve_vocabulary(data)
+    except ValidationError:
+        return data
+    if not isinstance(vocabulary, collections.abc.Iterable):
+        return data
+    # The value of the term encoded as the data.
+    for term in vocabulary:
+        if _encodeLeaf(field, term.value) == data:
+            return term.value
+    return data
+
+
+def _decodeChoice(field, data, validate):
+    if data is None:
+        value = field.missing_value
+    else:
+        value = _choiceValue(field, data)
+    if validate:
+        field.validate(value)
+    return value
+
+
+def _encodeCombination(field, value):
+    return [_encode(f, v) for f, v in zip(field.fields, value)]
+
+
+def _decodeCombination(field, data, validate):
+    if data is None:
+        value = field.missing_value
+    else:
+        if not isinstance(data, (list, tuple)) or (
+                len(data) != len(field.fields)):
+            raise ConversionError(data)
+        value = tuple(_decode(f, d, validate)
+                      for f, d in zip(field.fields, data))
+    if validate:
+        _validateOwn(field, value)
+    return value
+
+
+def _encodeUnion(field, value):
+    index = field.validFieldIndex(value)
+    if index is None:
+        raise ConversionError(value)
+    return [index, _encode(field.fields[index], value)]
+
+
+def _decodeUnion(field, data, validate):
+    if data is None:
+        value = field.missing_value
+    else:
+        index, payload = splitTag(field, data)
+        value = _decode(field.fields[index], payload, validate)
+    if validate:
+        _validateOwn(field, value)
+    return value
+
+
+_encoders = {
+    Combination: _encodeCombination,
+    Union: _encodeUnion,
+}
+
+_decoders = {
+    Combination: _decodeCombination,
+    Option: _decodeOption,
+    Union: _decodeUnion,
+    schema.Choice: _decodeChoice,
+}
+
+
+def _lookup(registry, field, default):
+    for cls in type(field).__mro__:
+        function = registry.get(cls)
+        if function is not None:
+            return function
+    return default
+
+
+def _encode(field, value):
+    if value == field.missing_value:
+        return None
+    return _lookup(_encoders, field, _encodeLeaf)(field, value)
+
+
+def encode(field, value, context=None):
+    """Return the JSON compatible encoding of the value of the field."""
+    if context is not None:
+        field = field.bind(context)
+    return _encode(field, value)
+
+
+def _decode(field, data, validate):
+    return _lookup(_decoders, field, _decodeLeaf)(field, data, validate)
+
+
+def decode(field, data, context=None, validate=True):
+    """Return the value of the field encoded as the data.
+
+    The value is validated unless `validate` is false.  Raise a
+    `ConversionError` if the data is not an encoding of a value of the
+    field.
+    """
+    if context is not None:
+        field = field.bind(context)
+    return _decode(field, data, validate)